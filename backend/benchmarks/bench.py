@@ -0,0 +1,429 @@
+"""
+Offline benchmark for /api/sync, /api/chat and /api/chat/batch.
+
+Serves the FastAPI app on a local port with Drive, Gemini and MongoDB replaced
+by in-process fakes (see fake_drive.py, fake_genai.py), drives it over HTTP,
+and reports throughput and latency percentiles. Run from backend/:
+
+    python -m benchmarks.bench --output results.json
+    python -m benchmarks.bench --files-per-folder 50 --drive-failure-rate 0.02 --compare results.json
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import logging
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+import httpx
+import uvicorn
+from googleapiclient.discovery import build_from_document
+from mongomock_motor import AsyncMongoMockClient
+
+from benchmarks.fake_drive import FakeDrive, FOLDER_MIME_TYPE
+from benchmarks.fake_genai import FakeGenai
+
+API_KEY = "bench-api-key"
+CREDENTIALS = {
+    "token": "bench-token",
+    "refresh_token": "bench-refresh-token",
+    "token_uri": "https://oauth2.googleapis.com/token",
+    "client_id": "bench-client",
+    "client_secret": "bench-secret",
+    "scopes": ["https://www.googleapis.com/auth/drive.readonly"]
+}
+
+QUESTIONS = [
+    "What are the key findings?",
+    "Summarize the quarterly report.",
+    "Which risks are mentioned?",
+    "List the action items.",
+    "Who are the stakeholders?",
+    "What changed since last year?",
+    "What is the budget?",
+    "Compare the two proposals."
+]
+
+# (path in the results, True if higher is better) shown by --compare
+COMPARED_METRICS = [
+    ("sync.files_per_sec", True),
+    ("sync.mb_per_sec", True),
+    ("sync.file_latency_ms.p50", False),
+    ("sync.file_latency_ms.p95", False),
+    ("sync.file_latency_ms.p99", False),
+    ("resync.seconds", False),
+    ("chat.requests_per_sec", True),
+    ("chat.latency_ms.p50", False),
+    ("chat.latency_ms.p95", False),
+    ("chat.latency_ms.p99", False),
+    ("batch.questions_per_sec", True),
+    ("batch.question_latency_ms.p95", False),
+    ("health_during_sync.p99", False),
+]
+
+def percentiles(samples):
+    """
+    count, mean, p50/p95/p99 (nearest rank) and max of a list of seconds, in milliseconds.
+    """
+    if not samples:
+        return None
+    ordered = sorted(samples)
+
+    def rank(p):
+        return ordered[min(len(ordered) - 1, max(0, math.ceil(p / 100 * len(ordered)) - 1))]
+
+    return {
+        "count": len(ordered),
+        "mean": round(sum(ordered) / len(ordered) * 1000, 2),
+        "p50": round(rank(50) * 1000, 2),
+        "p95": round(rank(95) * 1000, 2),
+        "p99": round(rank(99) * 1000, 2),
+        "max": round(ordered[-1] * 1000, 2)
+    }
+
+def install_fakes(drive, gemini):
+    """
+    Points the app's Google clients and database at the fakes.
+    """
+    import database
+    from services import google_api, rag_service
+
+    def build_service(api, version, credentials):
+        if api != 'drive':
+            raise RuntimeError(f"No fake for {api} {version}")
+        return build_from_document(google_api.get_discovery_document(api, version), http=drive)
+
+    google_api.build_service = build_service
+    rag_service.genai = gemini
+    database.db.client = AsyncMongoMockClient()
+    return database.db
+
+@contextlib.asynccontextmanager
+async def serve(app):
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=0, lifespan="off", log_level="warning"))
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        if task.done():
+            task.result()
+        await asyncio.sleep(0.01)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    try:
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        server.should_exit = True
+        await task
+
+async def probe_health(client, interval, samples, stop):
+    while not stop.is_set():
+        started = time.perf_counter()
+        await client.get("/health")
+        samples.append(time.perf_counter() - started)
+        await asyncio.sleep(interval)
+
+async def run_sync(client, drive, session_id, incremental=False, health_interval=None):
+    """
+    Runs one sync through POST /api/sync and times each file from its first event to its success.
+    """
+    items = [{"id": FakeDrive.ROOT_ID, "name": "Benchmark", "mimeType": FOLDER_MIME_TYPE}]
+    started, finished, failed = {}, {}, set()
+    complete = None
+    health, stop = [], asyncio.Event()
+    prober = asyncio.create_task(probe_health(client, health_interval, health, stop)) if health_interval else None
+
+    begin = time.perf_counter()
+    async with client.stream("POST", "/api/sync", json={"items": items, "incremental": incremental},
+                             headers={"x-session-id": session_id}) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if not line.strip():
+                continue
+            event = json.loads(line)
+            now = time.perf_counter()
+            file = event.get("file")
+            if file:
+                started.setdefault(file["id"], now)
+                if event["status"] == "success":
+                    finished[file["id"]] = now
+                elif event["status"] == "error":
+                    failed.add(file["id"])
+            elif event["status"] == "complete":
+                complete = event
+    elapsed = time.perf_counter() - begin
+
+    if prober:
+        stop.set()
+        await prober
+
+    synced_bytes = sum(drive.size_of(file_id) for file_id in finished)
+    return {
+        "seconds": round(elapsed, 3),
+        "files_total": len(drive.files),
+        "files_synced": len(finished),
+        "files_failed": len(failed - finished.keys()),
+        "files_unchanged": complete["unchanged"] if complete else None,
+        "megabytes": round(synced_bytes / 1e6, 3),
+        "files_per_sec": round(len(finished) / elapsed, 2) if elapsed else None,
+        "mb_per_sec": round(synced_bytes / 1e6 / elapsed, 3) if elapsed else None,
+        "file_latency_ms": percentiles([finished[file_id] - started[file_id] for file_id in finished]),
+        "completed": complete is not None
+    }, percentiles(health)
+
+async def run_chat(client, session_ids, turns, endpoint, seed):
+    """
+    Every session asks `turns` questions one after another; sessions run concurrently.
+    """
+    latencies, first_bytes, errors = [], [], 0
+    rng = random.Random(seed)
+    plans = {session_id: [rng.choice(QUESTIONS) for _ in range(turns)] for session_id in session_ids}
+
+    async def user(session_id):
+        nonlocal errors
+        for question in plans[session_id]:
+            begin = time.perf_counter()
+            headers = {"x-session-id": session_id}
+            try:
+                if endpoint == "stream":
+                    first = None
+                    async with client.stream("POST", "/api/chat/stream", json={"message": question}, headers=headers) as response:
+                        response.raise_for_status()
+                        async for line in response.aiter_lines():
+                            if not line.strip():
+                                continue
+                            if first is None:
+                                first = time.perf_counter() - begin
+                            if json.loads(line)["status"] == "error":
+                                errors += 1
+                    first_bytes.append(first or 0)
+                else:
+                    response = await client.post("/api/chat", json={"message": question}, headers=headers)
+                    response.raise_for_status()
+            except httpx.HTTPError:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - begin)
+
+    begin = time.perf_counter()
+    await asyncio.gather(*(user(session_id) for session_id in session_ids))
+    elapsed = time.perf_counter() - begin
+
+    results = {
+        "endpoint": "/api/chat/stream" if endpoint == "stream" else "/api/chat",
+        "seconds": round(elapsed, 3),
+        "requests": len(latencies),
+        "errors": errors,
+        "requests_per_sec": round(len(latencies) / elapsed, 2) if elapsed else None,
+        "latency_ms": percentiles(latencies)
+    }
+    if endpoint == "stream":
+        results["first_event_ms"] = percentiles(first_bytes)
+    return results
+
+async def run_batch(client, session_id, count):
+    """
+    Sends `count` distinct questions in one /api/chat/batch request, bypassing the answer cache.
+    """
+    questions = [f"{QUESTIONS[index % len(QUESTIONS)]} (#{index})" for index in range(count)]
+    latencies, errors, first = [], 0, None
+    begin = time.perf_counter()
+    async with client.stream("POST", "/api/chat/batch", json={"questions": questions, "use_cache": False},
+                             headers={"x-session-id": session_id}) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if not line.strip():
+                continue
+            event = json.loads(line)
+            if event["status"] == "complete":
+                continue
+            if first is None:
+                first = time.perf_counter() - begin
+            if event["status"] == "error":
+                errors += 1
+            else:
+                latencies.append(event["latency_ms"] / 1000)
+    elapsed = time.perf_counter() - begin
+
+    return {
+        "seconds": round(elapsed, 3),
+        "questions": count,
+        "answered": len(latencies),
+        "errors": errors,
+        "questions_per_sec": round(len(latencies) / elapsed, 2) if elapsed else None,
+        "first_result_ms": round((first or 0) * 1000, 2),
+        # As reported by the server for each question
+        "question_latency_ms": percentiles(latencies)
+    }
+
+async def run(args):
+    drive = FakeDrive(
+        folders=args.folders, depth=args.depth, files_per_folder=args.files_per_folder,
+        min_size=args.min_size_kb * 1000, max_size=args.max_size_kb * 1000, doc_ratio=args.doc_ratio,
+        latency=args.drive_latency, bandwidth=args.drive_bandwidth_mb * 1e6,
+        failure_rate=args.drive_failure_rate, seed=args.seed
+    )
+    gemini = FakeGenai(
+        upload_latency=args.upload_latency, upload_bandwidth=args.upload_bandwidth_mb * 1e6,
+        index_latency=args.index_latency, index_rate=args.index_rate_mb * 1e6,
+        chat_latency=args.chat_latency, failure_rate=args.gemini_failure_rate, seed=args.seed
+    )
+    db = install_fakes(drive, gemini)
+
+    import main
+    from services import sync_jobs, executor
+
+    database = db.get_db()
+    await db.ensure_indexes()
+    await database.sessions.insert_one({
+        "session_id": "bench-sync", "credentials": CREDENTIALS, "gemini_api_key": API_KEY,
+        "user": {"email": "bench@example.com"}
+    })
+    sync_jobs.start_workers()
+
+    results = {}
+    try:
+        async with serve(main.app) as base_url:
+            async with httpx.AsyncClient(base_url=base_url, timeout=None) as client:
+                results["sync"], results["health_during_sync"] = await run_sync(
+                    client, drive, "bench-sync", health_interval=args.health_interval
+                )
+                results["resync"], _ = await run_sync(client, drive, "bench-sync", incremental=True)
+
+                store = (await database.sessions.find_one({"session_id": "bench-sync"}, {"store_name": 1})).get("store_name")
+                session_ids = [f"bench-chat-{index}" for index in range(args.chat_users)]
+                if store:
+                    await database.sessions.insert_many([
+                        {"session_id": session_id, "gemini_api_key": API_KEY, "store_name": store}
+                        for session_id in session_ids
+                    ])
+                    results["chat"] = await run_chat(client, session_ids, args.chat_turns, args.chat_endpoint, args.seed)
+                    results["answer_cache"] = (await client.get("/health")).json().get("answer_cache")
+                    if args.batch_questions:
+                        results["batch"] = await run_batch(client, session_ids[0], args.batch_questions)
+    finally:
+        await sync_jobs.stop_workers()
+        executor.shutdown()
+
+    results["backends"] = {
+        "drive_requests": drive.requests,
+        "drive_failures": drive.failures,
+        "drive_megabytes": round(drive.bytes_served / 1e6, 3),
+        "gemini_uploads": gemini.uploads,
+        "gemini_upload_failures": gemini.upload_failures,
+        "gemini_chat_calls": gemini.chat_calls,
+        "gemini_chat_failures": gemini.chat_failures
+    }
+    return results
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except Exception:
+        return None
+
+def lookup(results, path):
+    for part in path.split("."):
+        if not isinstance(results, dict):
+            return None
+        results = results.get(part)
+    return results
+
+def compare(baseline, current, metrics=COMPARED_METRICS):
+    print(f"\n{'metric':32} {'baseline':>12} {'current':>12} {'change':>9}")
+    for path, higher_is_better in metrics:
+        before, after = lookup(baseline, path), lookup(current, path)
+        if before is None or after is None:
+            continue
+        change = (after - before) / before * 100 if before else 0.0
+        better = change > 0 if higher_is_better else change < 0
+        marker = "" if abs(change) < 5 else (" +" if better else " -")
+        print(f"{path:32} {before:12.2f} {after:12.2f} {change:8.1f}%{marker}")
+
+def report(results):
+    sync, resync, chat, batch = results.get("sync"), results.get("resync"), results.get("chat"), results.get("batch")
+    if sync:
+        print(f"sync:   {sync['files_synced']}/{sync['files_total']} files, {sync['megabytes']} MB in {sync['seconds']}s "
+              f"({sync['files_per_sec']} files/s, {sync['mb_per_sec']} MB/s), {sync['files_failed']} failed")
+        if sync["file_latency_ms"]:
+            latency = sync["file_latency_ms"]
+            print(f"        per-file ms p50 {latency['p50']} / p95 {latency['p95']} / p99 {latency['p99']}")
+    if resync:
+        print(f"resync: {resync['files_unchanged']} unchanged in {resync['seconds']}s")
+    health = results.get("health_during_sync")
+    if health:
+        print(f"health during sync ms: p50 {health['p50']} / p99 {health['p99']} / max {health['max']}")
+    if chat and chat["latency_ms"]:
+        latency = chat["latency_ms"]
+        print(f"chat:   {chat['requests']} requests in {chat['seconds']}s ({chat['requests_per_sec']} req/s), "
+              f"{chat['errors']} errors; ms p50 {latency['p50']} / p95 {latency['p95']} / p99 {latency['p99']}")
+    if batch and batch["question_latency_ms"]:
+        latency = batch["question_latency_ms"]
+        print(f"batch:  {batch['answered']}/{batch['questions']} questions in {batch['seconds']}s "
+              f"({batch['questions_per_sec']} q/s), {batch['errors']} errors, first result {batch['first_result_ms']} ms; "
+              f"per-question ms p50 {latency['p50']} / p95 {latency['p95']}")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    tree = parser.add_argument_group("fake Drive")
+    tree.add_argument("--folders", type=int, default=6)
+    tree.add_argument("--depth", type=int, default=2)
+    tree.add_argument("--files-per-folder", type=int, default=20)
+    tree.add_argument("--min-size-kb", type=int, default=50)
+    tree.add_argument("--max-size-kb", type=int, default=2000)
+    tree.add_argument("--doc-ratio", type=float, default=0.1, help="fraction of files that are Google Docs")
+    tree.add_argument("--drive-latency", type=float, default=0.05, help="seconds per Drive request")
+    tree.add_argument("--drive-bandwidth-mb", type=float, default=50, help="MB/s per download")
+    tree.add_argument("--drive-failure-rate", type=float, default=0.0)
+
+    gemini = parser.add_argument_group("fake Gemini")
+    gemini.add_argument("--upload-latency", type=float, default=0.1)
+    gemini.add_argument("--upload-bandwidth-mb", type=float, default=20)
+    gemini.add_argument("--index-latency", type=float, default=1.0)
+    gemini.add_argument("--index-rate-mb", type=float, default=5, help="MB/s indexed per document")
+    gemini.add_argument("--chat-latency", type=float, default=0.8)
+    gemini.add_argument("--gemini-failure-rate", type=float, default=0.0)
+
+    load = parser.add_argument_group("load")
+    load.add_argument("--chat-users", type=int, default=8)
+    load.add_argument("--chat-turns", type=int, default=5)
+    load.add_argument("--chat-endpoint", choices=["chat", "stream"], default="chat")
+    load.add_argument("--batch-questions", type=int, default=100, help="questions in one /api/chat/batch request (0 to skip)")
+    load.add_argument("--health-interval", type=float, default=0.05, help="seconds between /health probes during sync")
+    load.add_argument("--seed", type=int, default=0)
+
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare against")
+    parser.add_argument("--log", default=os.devnull, help="where the app's own output goes")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    with open(args.log, "w") as log, contextlib.redirect_stdout(log):
+        results = asyncio.run(run(args))
+
+    results = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "params": {key: value for key, value in vars(args).items() if key not in ("output", "compare", "log")},
+        **results
+    }
+    report(results)
+
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(results, output, indent=2)
+        print(f"Results written to {args.output}")
+    if args.compare:
+        with open(args.compare) as baseline:
+            compare(json.load(baseline), results)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,163 @@
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from urllib.parse import urlparse, parse_qs
+
+import httplib2
+
+# An in-memory Drive served at the HTTP layer: googleapiclient builds and parses
+# real Drive v3 requests, and this object answers them instead of the network.
+# Covers the endpoints drive_service uses: files.list, files.get (metadata and
+# alt=media with Range), files.export (text exports are
+# TEXT_EXPORT_RATIO times smaller than PDF ones), changes.getStartPageToken and changes.list.
+
+FOLDER_MIME_TYPE = 'application/vnd.google-apps.folder'
+GOOGLE_DOC_MIME_TYPE = 'application/vnd.google-apps.document'
+
+# How much smaller a text export of a Google Doc is than its PDF export
+TEXT_EXPORT_RATIO = 8
+
+_PARENT_RE = re.compile(r"'([^']+)' in parents")
+
+# Shared filler for file bodies; files are served as slices of it
+_BLOCK = (" ".join(f"lorem{i} ipsum dolor sit amet" for i in range(4096))).encode()
+
+class FakeDrive:
+    """
+    A folder tree of `folders` folders (nested `depth` levels under ROOT_ID),
+    each holding `files_per_folder` files with sizes drawn uniformly from
+    [min_size, max_size] bytes. `doc_ratio` of the files are Google Docs.
+
+    Every request sleeps `latency` seconds; media transfers additionally take
+    len(chunk) / `bandwidth` seconds. A fraction `failure_rate` of requests
+    fail with HTTP 503.
+    """
+
+    ROOT_ID = "bench-root"
+
+    def __init__(self, folders=5, depth=2, files_per_folder=20, min_size=50_000, max_size=500_000,
+                 doc_ratio=0.1, latency=0.05, bandwidth=50_000_000, failure_rate=0.0, seed=0):
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.failure_rate = failure_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.items = {}
+        self.children = {self.ROOT_ID: []}
+        self._sizes = {}
+        self.requests = 0
+        self.failures = 0
+        self.bytes_served = 0
+        self._build(folders, depth, files_per_folder, min_size, max_size, doc_ratio)
+
+    def _build(self, folders, depth, files_per_folder, min_size, max_size, doc_ratio):
+        # Folders are spread evenly over `depth` levels so the crawl has to go breadth-first
+        levels = [[self.ROOT_ID]] + [[] for _ in range(depth)]
+        for index in range(folders):
+            level = index * depth // folders + 1
+            folder_id = f"folder-{index}"
+            parent = self._random.choice(levels[level - 1] or levels[0])
+            self._add(folder_id, f"Folder {index}", FOLDER_MIME_TYPE, parent)
+            self.children[folder_id] = []
+            levels[level].append(folder_id)
+            for number in range(files_per_folder):
+                size = self._random.randint(min_size, max_size)
+                if self._random.random() < doc_ratio:
+                    self._add(f"{folder_id}-file-{number}", f"Doc {index}-{number}", GOOGLE_DOC_MIME_TYPE, folder_id, size)
+                else:
+                    self._add(f"{folder_id}-file-{number}", f"Report {index}-{number}.pdf", 'application/pdf', folder_id, size)
+
+    def _add(self, item_id, name, mime_type, parent, size=None):
+        item = {"id": item_id, "name": name, "mimeType": mime_type,
+                "modifiedTime": "2024-01-01T00:00:00.000Z", "iconLink": ""}
+        if size is not None:
+            # Like Drive, Google Docs report no size or checksum; `size` is then what an export returns
+            self._sizes[item_id] = size
+            if mime_type != GOOGLE_DOC_MIME_TYPE:
+                item["size"] = str(size)
+                item["md5Checksum"] = hashlib.md5(item_id.encode()).hexdigest()
+        self.items[item_id] = item
+        self.children[parent].append(item_id)
+
+    @property
+    def files(self):
+        return [item for item in self.items.values() if item["mimeType"] != FOLDER_MIME_TYPE]
+
+    def size_of(self, file_id):
+        return self._sizes.get(file_id, 0)
+
+    # httplib2.Http interface used by googleapiclient
+    def request(self, uri, method="GET", body=None, headers=None, **kwargs):
+        with self._lock:
+            self.requests += 1
+            failed = self._random.random() < self.failure_rate
+            if failed:
+                self.failures += 1
+        time.sleep(self.latency)
+        if failed:
+            return self._json(503, {"error": {"code": 503, "message": "Backend Error (simulated)"}})
+
+        url = urlparse(uri)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        path = url.path.split("/drive/v3/", 1)[-1].strip("/").split("/")
+
+        if path == ["files"]:
+            return self._list(query)
+        if path == ["changes", "startPageToken"]:
+            return self._json(200, {"startPageToken": "1"})
+        if path == ["changes"]:
+            # Nothing changes inside a benchmark run
+            return self._json(200, {"changes": [], "newStartPageToken": query.get("pageToken")})
+        if path[0] == "files" and len(path) >= 2:
+            item = self.items.get(path[1])
+            if item is None:
+                return self._json(404, {"error": {"code": 404, "message": "File not found"}})
+            if path[2:] == ["export"] or query.get("alt") == "media":
+                return self._media(item, (headers or {}).get("range"), query.get("mimeType"))
+            return self._json(200, item)
+        return self._json(404, {"error": {"code": 404, "message": f"Unknown endpoint {url.path}"}})
+
+    def _list(self, query):
+        parents = _PARENT_RE.findall(query.get("q", ""))
+        matches = [self.items[child] for parent in parents for child in self.children.get(parent, [])]
+        offset = int(query.get("pageToken") or 0)
+        page_size = int(query.get("pageSize") or 100)
+        page = {"files": matches[offset:offset + page_size]}
+        if offset + page_size < len(matches):
+            page["nextPageToken"] = str(offset + page_size)
+        return self._json(200, page)
+
+    def _media(self, item, range_header, export_mime_type=None):
+        size = self.size_of(item["id"])
+        if export_mime_type and export_mime_type.startswith("text/"):
+            # Text exports carry the words without the PDF layout
+            size = max(1, size // TEXT_EXPORT_RATIO)
+        start, end = 0, size - 1
+        if range_header:
+            start, end = (int(value) for value in range_header.split("=", 1)[1].split("-"))
+            end = min(end, size - 1)
+        content = _slice(start, end + 1)
+        time.sleep(len(content) / self.bandwidth)
+        with self._lock:
+            self.bytes_served += len(content)
+        return httplib2.Response({"status": 206, "content-range": f"bytes {start}-{end}/{size}",
+                                  "content-length": str(len(content))}), content
+
+    @staticmethod
+    def _json(status, payload):
+        return httplib2.Response({"status": status, "content-type": "application/json"}), json.dumps(payload).encode()
+
+def _slice(start, stop):
+    """
+    Bytes [start, stop) of an endless repetition of _BLOCK.
+    """
+    parts = []
+    while start < stop:
+        offset = start % len(_BLOCK)
+        take = min(len(_BLOCK) - offset, stop - start)
+        parts.append(_BLOCK[offset:offset + take])
+        start += take
+    return b"".join(parts)
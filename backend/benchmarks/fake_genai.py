@@ -0,0 +1,228 @@
+import itertools
+import os
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+from google.genai import errors, types
+
+# Stand-in for the parts of google.genai.Client that rag_service uses:
+# file_search_stores (create/list/delete, upload_to_file_search_store,
+# documents.delete), operations.get, chats.create and models.generate_content.
+# Install with `rag_service.genai = FakeGenai(...)`.
+
+class FakeGenai:
+    """
+    Module-like object whose Client(api_key=...) returns clients sharing one
+    simulated backend.
+
+    Uploads take `upload_latency` + size / `upload_bandwidth` seconds and then
+    index for `index_latency` + size / `index_rate` seconds. Chat replies take
+    `chat_latency` seconds, streamed in `chat_chunks` chunks. A fraction
+    `failure_rate` of uploads and chat calls fail with a 429 quota error.
+    """
+
+    def __init__(self, upload_latency=0.1, upload_bandwidth=20_000_000, index_latency=1.0, index_rate=5_000_000,
+                 chat_latency=0.8, chat_chunks=8, failure_rate=0.0, seed=0):
+        self.upload_latency = upload_latency
+        self.upload_bandwidth = upload_bandwidth
+        self.index_latency = index_latency
+        self.index_rate = index_rate
+        self.chat_latency = chat_latency
+        self.chat_chunks = chat_chunks
+        self.failure_rate = failure_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._ids = itertools.count()
+        self.stores = {}
+        self.uploads = 0
+        self.upload_failures = 0
+        self.bytes_uploaded = 0
+        self.chat_calls = 0
+        self.chat_failures = 0
+        # document name -> when its upload operation finishes indexing
+        self.ready_at = {}
+
+    def Client(self, api_key=None, **kwargs):
+        return _Client(self)
+
+    def next_id(self):
+        return next(self._ids)
+
+    def should_fail(self):
+        with self._lock:
+            return self._random.random() < self.failure_rate
+
+class _Client:
+    def __init__(self, backend):
+        self.file_search_stores = _FileSearchStores(backend)
+        self.operations = _Operations(backend)
+        self.chats = _Chats(backend)
+        self.models = _Models(backend)
+
+    def close(self):
+        pass
+
+class _FileSearchStores:
+    def __init__(self, backend):
+        self._backend = backend
+        self.documents = SimpleNamespace(delete=self._delete_document)
+
+    def create(self, config=None):
+        backend = self._backend
+        store = SimpleNamespace(
+            name=f"fileSearchStores/bench-{backend.next_id()}",
+            display_name=(config or {}).get("display_name"),
+            create_time=datetime.now(timezone.utc)
+        )
+        with backend._lock:
+            backend.stores[store.name] = {"store": store, "documents": set()}
+        return store
+
+    def get(self, name, config=None):
+        with self._backend._lock:
+            entry = self._backend.stores.get(name)
+        if entry is None:
+            raise errors.ClientError(404, {"error": {"code": 404, "status": "NOT_FOUND", "message": f"{name} not found"}})
+        return entry["store"]
+
+    def list(self, config=None):
+        with self._backend._lock:
+            return [entry["store"] for entry in self._backend.stores.values()]
+
+    def delete(self, name, config=None):
+        with self._backend._lock:
+            self._backend.stores.pop(name, None)
+
+    def _delete_document(self, name, config=None):
+        store_name = name.split("/documents/", 1)[0]
+        with self._backend._lock:
+            entry = self._backend.stores.get(store_name)
+            if entry:
+                entry["documents"].discard(name)
+
+    def upload_to_file_search_store(self, file, file_search_store_name, config=None):
+        backend = self._backend
+        size = _consume(file)
+        time.sleep(backend.upload_latency + size / backend.upload_bandwidth)
+        with backend._lock:
+            backend.uploads += 1
+        if backend.should_fail():
+            with backend._lock:
+                backend.upload_failures += 1
+            raise _quota_error()
+
+        document_name = f"{file_search_store_name}/documents/doc-{backend.next_id()}"
+        with backend._lock:
+            backend.bytes_uploaded += size
+            entry = backend.stores.get(file_search_store_name)
+            if entry:
+                entry["documents"].add(document_name)
+        ready_at = time.monotonic() + backend.index_latency + size / backend.index_rate
+        with backend._lock:
+            backend.ready_at[document_name] = ready_at
+        return _operation(document_name, ready_at)
+
+class _Operations:
+    def __init__(self, backend):
+        self._backend = backend
+
+    def get(self, operation):
+        # Also works for a handle rebuilt from the operation's name alone
+        document_name = operation.name.split("/", 1)[1]
+        with self._backend._lock:
+            ready_at = self._backend.ready_at.get(document_name, 0)
+        return _operation(document_name, ready_at)
+
+def _operation(document_name, ready_at):
+    done = time.monotonic() >= ready_at
+    return SimpleNamespace(
+        name=f"operations/{document_name}",
+        done=done,
+        error=None,
+        response=SimpleNamespace(document_name=document_name) if done else None
+    )
+
+def _quota_error():
+    return errors.ClientError(429, {"error": {
+        "code": 429, "status": "RESOURCE_EXHAUSTED", "message": "Quota exceeded (simulated)",
+        "details": [{"@type": "type.googleapis.com/google.rpc.RetryInfo", "retryDelay": "0.2s"}]
+    }})
+
+def _consume(file):
+    """
+    Size of an upload given as a path or a readable file object (which is read through, like a real upload).
+    """
+    if isinstance(file, (str, os.PathLike)):
+        with open(file, "rb") as handle:
+            return _consume(handle)
+    size = 0
+    while True:
+        chunk = file.read(1024 * 1024)
+        if not chunk:
+            return size
+        size += len(chunk)
+
+class _Chats:
+    def __init__(self, backend):
+        self._backend = backend
+
+    def create(self, model=None, config=None, history=None):
+        return _Chat(self._backend, history or [])
+
+class _Chat:
+    def __init__(self, backend, history):
+        self._backend = backend
+        self._history = [item if isinstance(item, types.Content) else types.Content.model_validate(item)
+                         for item in history]
+
+    def get_history(self, curated=False):
+        return self._history
+
+    def record_history(self, user_input, model_output, automatic_function_calling_history=None, is_valid=True):
+        self._history.append(user_input)
+        self._history.extend(model_output)
+
+    def _answer(self, message):
+        backend = self._backend
+        with backend._lock:
+            backend.chat_calls += 1
+        if backend.should_fail():
+            with backend._lock:
+                backend.chat_failures += 1
+            raise _quota_error()
+        return f"Benchmark answer to: {message}. " + "The documents say a great deal about this. " * 10
+
+    def _reply(self, text):
+        return SimpleNamespace(text=text, candidates=[SimpleNamespace(grounding_metadata=None)])
+
+    def send_message(self, message):
+        time.sleep(self._backend.chat_latency)
+        text = self._answer(message)
+        self._record(message, text)
+        return self._reply(text)
+
+    def send_message_stream(self, message):
+        text = self._answer(message)
+        chunks = max(1, self._backend.chat_chunks)
+        step = -(-len(text) // chunks)
+        for start in range(0, len(text), step):
+            time.sleep(self._backend.chat_latency / chunks)
+            yield self._reply(text[start:start + step])
+        self._record(message, text)
+
+    def _record(self, message, text):
+        self.record_history(
+            types.Content(role="user", parts=[types.Part(text=message)]),
+            [types.Content(role="model", parts=[types.Part(text=text)])]
+        )
+
+class _Models:
+    def __init__(self, backend):
+        self._backend = backend
+
+    def generate_content(self, model=None, contents=None, config=None):
+        time.sleep(self._backend.chat_latency)
+        return SimpleNamespace(text="Benchmark summary of the conversation so far.")
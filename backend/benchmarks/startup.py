@@ -0,0 +1,150 @@
+"""
+Cold start benchmark: how long a fresh process takes to import the app, to
+start serving and to finish its background warm-up. Every run is a new Python
+process, so nothing is cached in memory between runs. MongoDB is replaced by
+mongomock; nothing touches the network. Run from backend/:
+
+    python -m benchmarks.startup --output startup.json
+    python -m benchmarks.startup --compare startup.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import re
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+# (path in the results, True if higher is better) shown by --compare
+COMPARED_METRICS = [
+    ("import_main_ms.median", False),
+    ("start_to_serving_ms.median", False),
+    ("start_to_ready_ms.median", False),
+    ("warmup_ms.median", False),
+]
+
+def child():
+    """
+    Runs in the measured process: imports the app, runs its startup and waits
+    for the warm-up, then prints the timings as JSON on one line.
+    Wall-clock timestamps (time.time()) let the parent measure from the moment it spawned us.
+    """
+    started = time.perf_counter()
+    import main
+    imported = time.perf_counter()
+
+    from mongomock_motor import AsyncMongoMockClient
+    import database
+    database.db.client = AsyncMongoMockClient()
+    mock_setup = time.perf_counter() - imported
+
+    async def run():
+        async with main.app.router.lifespan_context(main.app):
+            serving_at = time.time()
+            await main.app.state.warmup
+            ready_at = time.time()
+        return serving_at, ready_at
+
+    serving_at, ready_at = asyncio.run(run())
+    print(json.dumps({
+        "import_main": imported - started,
+        # spent on the benchmark's own mock, not the app: subtracted by the parent
+        "mock_setup": mock_setup,
+        "serving_at": serving_at,
+        "ready_at": ready_at
+    }), file=sys.__stdout__, flush=True)
+
+def measure_once():
+    """
+    Spawns one process. Start-to-* times include interpreter start-up.
+    """
+    spawned_at = time.time()
+    process = subprocess.run([sys.executable, "-m", "benchmarks.startup", "--child"], capture_output=True, text=True)
+    if process.returncode != 0:
+        raise RuntimeError(f"Startup run failed:\n{process.stderr}")
+    timings = json.loads(process.stdout.strip().splitlines()[-1])
+    return {
+        "import_main": timings["import_main"],
+        "start_to_serving": timings["serving_at"] - spawned_at - timings["mock_setup"],
+        "start_to_ready": timings["ready_at"] - spawned_at - timings["mock_setup"],
+        "warmup": timings["ready_at"] - timings["serving_at"]
+    }
+
+def slowest_imports(count):
+    """
+    The `count` modules with the largest cumulative import time under `import main` (-X importtime).
+    """
+    process = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"],
+                             capture_output=True, text=True)
+    entries = []
+    for line in process.stderr.splitlines():
+        match = re.match(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)", line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            entries.append({"module": name, "depth": len(indent) // 2, "cumulative_ms": int(cumulative_us) / 1000,
+                            "self_ms": int(self_us) / 1000})
+    top_level = [entry for entry in entries if entry["depth"] <= 1]
+    return sorted(top_level, key=lambda entry: -entry["cumulative_ms"])[:count]
+
+def summarize(samples):
+    ordered = sorted(samples)
+    return {
+        "median": round(statistics.median(ordered) * 1000, 2),
+        "min": round(ordered[0] * 1000, 2),
+        "max": round(ordered[-1] * 1000, 2)
+    }
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="fresh processes to start")
+    parser.add_argument("--top", type=int, default=10, help="slowest imports to list")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare against")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.child:
+        # The app's own output would be mixed into the timings line
+        sys.stdout = open(os.devnull, "w")
+        return child()
+
+    # Imported here, not at the top: the measured child must not load the benchmark's dependencies
+    from benchmarks.bench import compare, git_commit
+
+    # One unmeasured run so every measured one finds compiled bytecode on disk
+    measure_once()
+    runs = [measure_once() for _ in range(args.runs)]
+
+    results = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "runs": args.runs,
+        **{f"{name}_ms": summarize([run[name] for run in runs])
+           for name in ("import_main", "start_to_serving", "start_to_ready", "warmup")},
+        "slowest_imports": slowest_imports(args.top)
+    }
+
+    for name in ("import_main", "start_to_serving", "start_to_ready", "warmup"):
+        timing = results[f"{name}_ms"]
+        print(f"{name + ':':18} median {timing['median']} ms (min {timing['min']}, max {timing['max']})")
+    print("\nslowest imports under `import main` (cumulative ms):")
+    for entry in results["slowest_imports"]:
+        print(f"  {entry['cumulative_ms']:9.1f}  {'  ' * entry['depth']}{entry['module']}")
+
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(results, output, indent=2)
+        print(f"Results written to {args.output}")
+    if args.compare:
+        with open(args.compare) as baseline:
+            compare(json.load(baseline), results, COMPARED_METRICS)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -45,3 +45,109 @@ os.environ['OAUTHLIB_RELAX_TOKEN_SCOPE'] = '1'
 
 # Server
 PORT = int(os.getenv("PORT", 5678))
+
+# Sync
+# Number of files a single /api/sync request works on at once
+SYNC_CONCURRENCY_PER_SESSION = int(os.getenv("SYNC_CONCURRENCY_PER_SESSION", 4))
+# Upper bound on files being processed across all sessions in this worker
+SYNC_CONCURRENCY_GLOBAL = int(os.getenv("SYNC_CONCURRENCY_GLOBAL", 8))
+# Upper bound on bytes of downloaded-but-not-yet-uploaded files across all syncs in this worker
+SYNC_GLOBAL_BYTE_BUDGET = int(os.getenv("SYNC_GLOBAL_BYTE_BUDGET", 512 * 1024 * 1024))
+
+# Threads used to run blocking Google SDK calls off the event loop: BLOCKING_POOL_SIZE
+# for interactive requests (chat, browsing, login), BULK_POOL_SIZE for syncs and other
+# background work, so indexing can never occupy the threads a chat reply needs
+BLOCKING_POOL_SIZE = int(os.getenv("BLOCKING_POOL_SIZE", 32))
+BULK_POOL_SIZE = int(os.getenv("BULK_POOL_SIZE", 32))
+
+# Drive folder crawl
+# Folder IDs combined into one "'a' in parents or 'b' in parents" query
+DRIVE_CRAWL_BATCH_SIZE = int(os.getenv("DRIVE_CRAWL_BATCH_SIZE", 10))
+# files().list pages fetched concurrently while crawling
+DRIVE_CRAWL_CONCURRENCY = int(os.getenv("DRIVE_CRAWL_CONCURRENCY", 4))
+
+# Bytes fetched per Drive download request; bounds per-file memory during sync
+DRIVE_DOWNLOAD_CHUNK_SIZE = int(os.getenv("DRIVE_DOWNLOAD_CHUNK_SIZE", 8 * 1024 * 1024))
+
+# Downloads up to this size stay in memory; larger ones spill to one anonymous temp file
+DRIVE_SPOOL_MAX_BYTES = int(os.getenv("DRIVE_SPOOL_MAX_BYTES", 8 * 1024 * 1024))
+
+# Chat context sent to the model on each turn
+# "window": last CHAT_HISTORY_MAX_TURNS turns
+# "tokens": as many recent turns as fit in CHAT_HISTORY_TOKEN_BUDGET
+# "summary": a rolling summary of older turns plus every turn not folded into it yet
+#            (CHAT_HISTORY_MAX_TURNS to CHAT_HISTORY_MAX_TURNS + CHAT_SUMMARY_BATCH_TURNS turns)
+CHAT_CONTEXT_POLICY = os.getenv("CHAT_CONTEXT_POLICY", "window")
+CHAT_HISTORY_MAX_TURNS = int(os.getenv("CHAT_HISTORY_MAX_TURNS", 10))
+CHAT_HISTORY_TOKEN_BUDGET = int(os.getenv("CHAT_HISTORY_TOKEN_BUDGET", 8000))
+# Older turns are folded into the summary in batches of this many turns
+CHAT_SUMMARY_BATCH_TURNS = int(os.getenv("CHAT_SUMMARY_BATCH_TURNS", 5))
+
+# Live Gemini clients/chat objects kept per (session, store) between turns
+CHAT_CACHE_SIZE = int(os.getenv("CHAT_CACHE_SIZE", 256))
+CHAT_CACHE_TTL_SECONDS = int(os.getenv("CHAT_CACHE_TTL_SECONDS", 30 * 60))
+
+# /api/chat/batch: questions per request, and how many of them are answered at once
+CHAT_BATCH_MAX_QUESTIONS = int(os.getenv("CHAT_BATCH_MAX_QUESTIONS", 1000))
+CHAT_BATCH_CONCURRENCY = int(os.getenv("CHAT_BATCH_CONCURRENCY", 8))
+
+# Ready-built googleapiclient service objects kept per credential
+GOOGLE_SERVICE_POOL_USERS = int(os.getenv("GOOGLE_SERVICE_POOL_USERS", 128))
+GOOGLE_SERVICE_POOL_PER_USER = int(os.getenv("GOOGLE_SERVICE_POOL_PER_USER", 8))
+GOOGLE_SERVICE_POOL_TTL_SECONDS = int(os.getenv("GOOGLE_SERVICE_POOL_TTL_SECONDS", 15 * 60))
+
+# In-process read-through cache of session documents
+SESSION_CACHE_SIZE = int(os.getenv("SESSION_CACHE_SIZE", 1024))
+SESSION_CACHE_TTL_SECONDS = int(os.getenv("SESSION_CACHE_TTL_SECONDS", 30))
+
+# Polling of File Search indexing operations (seconds)
+OPERATION_POLL_MIN_INTERVAL = float(os.getenv("OPERATION_POLL_MIN_INTERVAL", 0.5))
+OPERATION_POLL_MAX_INTERVAL = float(os.getenv("OPERATION_POLL_MAX_INTERVAL", 10))
+OPERATION_POLL_BACKOFF = float(os.getenv("OPERATION_POLL_BACKOFF", 1.5))
+
+# Answers cached per (store, question, history window)
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", 1024))
+ANSWER_CACHE_TTL_SECONDS = int(os.getenv("ANSWER_CACHE_TTL_SECONDS", 60 * 60))
+
+# Folder listings for /api/drive/list: served as-is for FRESH seconds, then
+# revalidated against the folder's modifiedTime until MAX_AGE
+DRIVE_LIST_CACHE_SIZE = int(os.getenv("DRIVE_LIST_CACHE_SIZE", 2048))
+DRIVE_LIST_CACHE_FRESH_SECONDS = int(os.getenv("DRIVE_LIST_CACHE_FRESH_SECONDS", 30))
+DRIVE_LIST_CACHE_MAX_AGE_SECONDS = int(os.getenv("DRIVE_LIST_CACHE_MAX_AGE_SECONDS", 5 * 60))
+
+# File Search store garbage collection
+# Stores unused for this long (and not the current store of any session) are deleted
+STORE_IDLE_TTL_SECONDS = int(os.getenv("STORE_IDLE_TTL_SECONDS", 7 * 24 * 60 * 60))
+STORE_SWEEP_INTERVAL_SECONDS = int(os.getenv("STORE_SWEEP_INTERVAL_SECONDS", 60 * 60))
+# Stores (one per synced selection) a session can chat over at once; adding another drops the oldest
+SESSION_MAX_STORES = int(os.getenv("SESSION_MAX_STORES", 10))
+
+# Background sync jobs
+# Syncs running at once in this worker; further ones wait in a queue served round-robin by session
+SYNC_JOB_WORKERS = int(os.getenv("SYNC_JOB_WORKERS", 4))
+# A running job whose worker has not checked in for this long is resumed by another worker
+SYNC_JOB_LEASE_SECONDS = int(os.getenv("SYNC_JOB_LEASE_SECONDS", 60))
+# Progress events kept per job for clients that reattach
+SYNC_JOB_EVENT_LOG_SIZE = int(os.getenv("SYNC_JOB_EVENT_LOG_SIZE", 200))
+
+# Sync planning and scheduling
+# Bytes of downloaded-but-not-yet-uploaded files one sync may hold at once
+SYNC_BYTE_BUDGET = int(os.getenv("SYNC_BYTE_BUDGET", 256 * 1024 * 1024))
+# Assumed size of files Drive reports no size for (Google Docs exports)
+SYNC_UNKNOWN_FILE_BYTES = int(os.getenv("SYNC_UNKNOWN_FILE_BYTES", 1024 * 1024))
+# Fixed per-file cost (API round trips, indexing) expressed in bytes, for estimates
+SYNC_FILE_OVERHEAD_BYTES = int(os.getenv("SYNC_FILE_OVERHEAD_BYTES", 1024 * 1024))
+# Starting throughput for duration estimates; refined from completed syncs
+SYNC_ESTIMATE_BYTES_PER_SECOND = int(os.getenv("SYNC_ESTIMATE_BYTES_PER_SECOND", 4 * 1024 * 1024))
+
+# Client-side rate limits, per Drive user and per Gemini API key (requests per second, burst)
+DRIVE_RATE_LIMIT_PER_SECOND = float(os.getenv("DRIVE_RATE_LIMIT_PER_SECOND", 50))
+DRIVE_RATE_LIMIT_BURST = int(os.getenv("DRIVE_RATE_LIMIT_BURST", 100))
+GEMINI_RATE_LIMIT_PER_SECOND = float(os.getenv("GEMINI_RATE_LIMIT_PER_SECOND", 20))
+GEMINI_RATE_LIMIT_BURST = int(os.getenv("GEMINI_RATE_LIMIT_BURST", 40))
+# Retries of throttled (429, Drive rate-limit 403) and 5xx responses; backoff doubles from BASE up to MAX seconds
+RATE_LIMIT_MAX_RETRIES = int(os.getenv("RATE_LIMIT_MAX_RETRIES", 6))
+RATE_LIMIT_BACKOFF_BASE = float(os.getenv("RATE_LIMIT_BACKOFF_BASE", 1))
+RATE_LIMIT_BACKOFF_MAX = float(os.getenv("RATE_LIMIT_BACKOFF_MAX", 60))
+# Share of each bucket's burst that sync and other background calls leave for chat and browsing
+RATE_LIMIT_INTERACTIVE_RESERVE = float(os.getenv("RATE_LIMIT_INTERACTIVE_RESERVE", 0.25))
@@ -7,6 +7,8 @@ class Database:
     client: AsyncIOMotorClient = None
 
     def connect(self):
+        if self.client:
+            return
         if not MONGO_URI:
             print("CRITICAL ERROR: MONGO_URI not found in environment variables.")
             return
@@ -28,6 +30,28 @@ class Database:
              
         return self.client[DB_NAME]
 
+    async def ping(self):
+        """
+        Round trip to the server, which also opens the client's first connections.
+        """
+        await self.get_db().command("ping")
+
+    async def ensure_indexes(self):
+        """
+        Creates the indexes every hot query relies on. Safe to call repeatedly.
+        """
+        database = self.get_db()
+        await database.sessions.create_index("session_id", unique=True)
+        await database.chat_turns.create_index([("session_id", 1), ("_id", -1)])
+        await database.sync_manifests.create_index([("store_name", 1), ("file_id", 1)], unique=True)
+        await database.file_search_stores.create_index("store_name", unique=True)
+        await database.file_search_stores.create_index([("owner", 1), ("folder_key", 1), ("api_key_hash", 1)])
+        await database.sessions.create_index("store_name")
+        await database.sessions.create_index("stores.store_name")
+        await database.sync_jobs.create_index("job_id", unique=True)
+        await database.sync_jobs.create_index([("status", 1), ("heartbeat_at", 1)])
+        await database.sync_jobs.create_index([("session_id", 1), ("status", 1)])
+
     def close(self):
         if self.client:
             self.client.close()
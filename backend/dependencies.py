@@ -1,27 +1,35 @@
 from fastapi import Header, HTTPException
 from services.session_service import get_session_data
 
-async def get_current_session(x_session_id: str = Header(None)):
+def current_session(*fields):
     """
-    Dependency to retrieve the current session based on the x-session-id header.
-    Raises 400 if header is missing.
-    Raises 401 if session is not found or invalid.
+    Dependency returning the session named by the x-session-id header, loading
+    only the given top-level fields (e.g. Depends(current_session("credentials"))).
+    Raises 400 if the header is missing and 401 if the session is not found.
     """
-    if not x_session_id:
-        raise HTTPException(status_code=400, detail="Session ID required")
-    
-    session = await get_session_data(x_session_id)
-    if not session:
-        # For login endpoint, we might not have a session yet, but for protected routes we need it.
-        # This dependency is strict. For optional session, use a different one.
-        raise HTTPException(status_code=401, detail="Session not found or expired")
-        
-    return session
+    projection = {field: 1 for field in fields}
 
-async def get_optional_session(x_session_id: str = Header(None)):
+    async def dependency(x_session_id: str = Header(None)):
+        if not x_session_id:
+            raise HTTPException(status_code=400, detail="Session ID required")
+
+        session = await get_session_data(x_session_id, projection)
+        if not session:
+            raise HTTPException(status_code=401, detail="Session not found or expired")
+        return session
+
+    return dependency
+
+def optional_session(*fields):
     """
-    Dependency to retrieve session if it exists, but doesn't enforce it.
+    Like current_session, but returns None instead of raising when there is
+    no session.
     """
-    if not x_session_id:
-        return None
-    return await get_session_data(x_session_id)
+    projection = {field: 1 for field in fields}
+
+    async def dependency(x_session_id: str = Header(None)):
+        if not x_session_id:
+            return None
+        return await get_session_data(x_session_id, projection)
+
+    return dependency
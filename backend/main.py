@@ -1,9 +1,18 @@
-from fastapi import FastAPI
+import time
+_import_started = time.perf_counter()
+
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
 from database import db
+from services import executor, answer_cache
+from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
 from config import MONGO_URI, FRONTEND_URL, PORT
 from routers import auth, drive, chat
+from services.store_registry import run_sweeper
+from services import sync_jobs, warmup
+from services.metrics import STARTUP_SECONDS
 from datetime import datetime
+import asyncio
 import os
 
 app = FastAPI()
@@ -26,10 +35,18 @@ app.add_middleware(
 @app.on_event("startup")
 async def startup_db_client():
     db.connect()
+    # Mongo ping, indexes and SDK imports run in the background; /health reports "ready" when done
+    app.state.warmup = asyncio.create_task(warmup.warm_up())
+    app.state.store_sweeper = asyncio.create_task(run_sweeper())
+    sync_jobs.start_workers()
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    app.state.store_sweeper.cancel()
+    app.state.warmup.cancel()
+    await sync_jobs.stop_workers()
     db.close()
+    executor.shutdown()
 
 @app.get("/")
 def read_root():
@@ -43,15 +60,24 @@ def health_check():
         "status": "healthy",
         "timestamp": datetime.now().isoformat(),
         "database": db_status,
-        "mongo_configured": bool(MONGO_URI)
+        "mongo_configured": bool(MONGO_URI),
+        "ready": warmup.status["ready"],
+        "answer_cache": answer_cache.stats()
     }
 
+@app.get("/metrics")
+def metrics():
+    """Prometheus metrics: per-stage timings, cache statistics and in-flight work"""
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
 # Include Routers
 app.include_router(auth.router)
 app.include_router(auth.callback_router)
 app.include_router(drive.router)
 app.include_router(chat.router)
 
+STARTUP_SECONDS.labels("imports").set(time.perf_counter() - _import_started)
+
 if __name__ == "__main__":
     import uvicorn
     is_prod = os.getenv("ENVIRONMENT") == "production"
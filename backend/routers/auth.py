@@ -1,9 +1,12 @@
 from fastapi import APIRouter, HTTPException, Depends, Header
 from fastapi.responses import RedirectResponse, JSONResponse
-from google_auth_oauthlib.flow import Flow
-from googleapiclient.discovery import build
+from services.google_api import build_service
 from config import GOOGLE_CLIENT_ID, GOOGLE_CLIENT_SECRET, REDIRECT_URI, SCOPES, FRONTEND_URL
-from services.session_service import get_session_data, save_session_data, delete_session_data, get_current_session, get_optional_session
+from services.session_service import save_session_data, delete_session_data
+from dependencies import optional_session
+from services.executor import run_blocking
+from services.chat_cache import invalidate_session
+from services.history_service import clear_history
 from pydantic import BaseModel
 import logging
 
@@ -23,6 +26,9 @@ async def login(x_session_id: str = Header(None)):
         raise HTTPException(status_code=400, detail="Session ID header is required")
     
     try:
+        # Imported on first use: it pulls in oauthlib and requests, which slow down startup
+        from google_auth_oauthlib.flow import Flow
+
         flow = Flow.from_client_config(
             {
                 "web": {
@@ -57,6 +63,8 @@ async def callback(code: str, state: str = None):
 
         session_id = state
 
+        from google_auth_oauthlib.flow import Flow
+
         flow = Flow.from_client_config(
             {
                 "web": {
@@ -71,13 +79,13 @@ async def callback(code: str, state: str = None):
             state=state
         )
         
-        flow.fetch_token(code=code)
+        await run_blocking(flow.fetch_token, code=code)
         credentials = flow.credentials
         
         # Fetch User Info
         try:
-            service = build('oauth2', 'v2', credentials=credentials)
-            user_info = service.userinfo().get().execute()
+            service = build_service('oauth2', 'v2', credentials)
+            user_info = await run_blocking(service.userinfo().get().execute)
         except Exception as e:
             logger.error(f"Failed to fetch user info: {e}")
             user_info = {}
@@ -92,14 +100,14 @@ async def callback(code: str, state: str = None):
         }
         
         # Update session in DB
-        session_data = await get_session_data(session_id) or {}
-        session_data["credentials"] = creds_data
-        session_data["user"] = {
-            "name": user_info.get("name"),
-            "email": user_info.get("email"),
-            "picture": user_info.get("picture")
-        }
-        await save_session_data(session_id, session_data)
+        await save_session_data(session_id, {
+            "credentials": creds_data,
+            "user": {
+                "name": user_info.get("name"),
+                "email": user_info.get("email"),
+                "picture": user_info.get("picture")
+            }
+        })
         
         return RedirectResponse(f"{FRONTEND_URL}?auth=success")
     except Exception as e:
@@ -111,7 +119,7 @@ async def callback(code: str, state: str = None):
 # I will restore the code as best as I can, but I'll add the missing definitions.
 
 @router.get("/status")
-async def auth_status(session: dict = Depends(get_optional_session)):
+async def auth_status(session: dict = Depends(optional_session("credentials", "gemini_api_key", "user"))):
     if session and "credentials" in session:
         return {
             "authenticated": True, 
@@ -121,13 +129,18 @@ async def auth_status(session: dict = Depends(get_optional_session)):
     return {"authenticated": False}
 
 @router.post("/apikey")
-async def save_api_key(request: ApiKeyRequest, x_session_id: str = Header(None), session: dict = Depends(get_current_session)):
-    session["gemini_api_key"] = request.api_key
-    await save_session_data(x_session_id, session)
+async def save_api_key(request: ApiKeyRequest, x_session_id: str = Header(None)):
+    if not x_session_id:
+        raise HTTPException(status_code=400, detail="Session ID header is required")
+    
+    await save_session_data(x_session_id, {"gemini_api_key": request.api_key})
+    invalidate_session(x_session_id)
     return {"message": "API Key saved"}
 
 @router.get("/logout")
 async def logout(x_session_id: str = Header(None)):
     if x_session_id:
+        await clear_history(x_session_id)
         await delete_session_data(x_session_id)
+        invalidate_session(x_session_id)
     return {"message": "Logged out"}
@@ -1,38 +1,278 @@
-from fastapi import APIRouter, Depends, HTTPException, Header
-from schemas import ChatRequest
-from dependencies import get_current_session
-from services.rag_service import create_chat_session, generate_response, get_client
-from services.session_service import save_session_data
+from fastapi import APIRouter, Depends, HTTPException, Header, BackgroundTasks
+from fastapi.responses import StreamingResponse
+from functools import partial
+import asyncio
+import json
+import time
+from schemas import ChatRequest, BatchChatRequest
+from dependencies import current_session
+from config import CHAT_CONTEXT_POLICY, CHAT_BATCH_MAX_QUESTIONS, CHAT_BATCH_CONCURRENCY
+from services.rag_service import (
+    BLOCKED_RESPONSE, create_chat_session, generate_answer, stream_response, record_turn,
+    get_client, close_client, summarize_conversation
+)
+from services.answer_cache import get_answer, put_answer
+from services.history_service import load_context, append_turn, update_summary, fits_context
+from services.chat_cache import checkout_chat, checkin_chat, invalidate_session
+from services.store_registry import session_store_names, detach_store
+from services.executor import run_blocking, run_bulk, iterate_blocking
+from services.metrics import CHAT_GENERATION_SECONDS, CHAT_FIRST_TOKEN_SECONDS, CHAT_ANSWERS, CHATS_IN_PROGRESS
 
 router = APIRouter(prefix="/api", tags=["chat"])
 
-@router.post("/chat")
-async def chat(request: ChatRequest, x_session_id: str = Header(None), session: dict = Depends(get_current_session)):
-    if "store_name" not in session:
+# chat_history is only present on sessions from before chat_turns; load_context moves it
+CHAT_SESSION_FIELDS = ("store_name", "stores", "gemini_api_key", "chat_summary", "chat_summary_upto", "chat_history")
+
+def require_chat_ready(session):
+    """
+    Validates the session can chat and returns its Gemini API key.
+    """
+    if not session_store_names(session):
         raise HTTPException(status_code=400, detail="Chat session not initialized. Please sync a folder first.")
-    
+
     api_key = session.get("gemini_api_key")
     if not api_key:
         raise HTTPException(status_code=400, detail="Gemini API Key not set.")
+    return api_key
+
+async def open_chat(session_id, session, api_key):
+    """
+    Returns (client, chat_session), reusing the live ones from the previous turn when possible.
+    The caller hands them back with finish_turn once the turn is done.
+    """
+    store_names = session_store_names(session)
+    cached = checkout_chat(session_id, store_names, api_key)
+    client = cached["client"] if cached else await run_blocking(get_client, api_key)
+
+    if cached and fits_context(cached["chat"].get_history(curated=True)):
+        return client, cached["chat"]
+
+    # Rehydrate chat session from a bounded window of history
+    history = await load_context(session_id, session)
+    chat_session = await run_blocking(create_chat_session, client, store_names, history=history)
+    return client, chat_session
+
+async def finish_turn(session_id, session, api_key, client, chat_session, message, response_text, background_tasks):
+    checkin_chat(session_id, session_store_names(session), api_key, client, chat_session)
+    await append_turn(session_id, message, response_text)
+    if CHAT_CONTEXT_POLICY == "summary":
+        background_tasks.add_task(update_summary, session_id, session, partial(summarize_conversation, client))
+
+def public_stores(session):
+    """
+    The session's stores as listed by the API. A session synced before store
+    sets has one store without a folder_key or name.
+    """
+    entries = session.get("stores") or [{"store_name": name} for name in session_store_names(session)]
+    return [{"folder_key": entry.get("folder_key"), "name": entry.get("name"), "store_name": entry["store_name"]}
+            for entry in entries]
+
+@router.get("/chat/stores")
+async def list_chat_stores(session: dict = Depends(current_session("store_name", "stores"))):
+    """
+    The synced selections the session chats over, oldest first.
+    """
+    return {"stores": public_stores(session)}
+
+@router.delete("/chat/stores/{folder_key}")
+async def remove_chat_store(folder_key: str, x_session_id: str = Header(None), session: dict = Depends(current_session("session_id"))):
+    """
+    Stops chatting over a synced selection. Its store is kept for a while, so
+    syncing the selection again with "add" does not re-index it.
+    """
+    stores = await detach_store(x_session_id, folder_key)
+    if stores is None:
+        raise HTTPException(status_code=404, detail="Store not found in this session")
+    invalidate_session(x_session_id)
+    return {"stores": public_stores({"stores": stores})}
+
+@router.post("/chat")
+async def chat(request: ChatRequest, background_tasks: BackgroundTasks, x_session_id: str = Header(None), session: dict = Depends(current_session(*CHAT_SESSION_FIELDS))):
+    api_key = require_chat_ready(session)
 
     try:
-        # Rehydrate chat session
-        history = session.get("chat_history", [])
-        
-        # Instantiate client here to keep it alive
-        client = get_client(api_key)
-        
-        chat_session = create_chat_session(client, session["store_name"], history=history)
-        response_text = generate_response(chat_session, request.message)
-        
-        # Update history manually
-        new_history = history or []
-        new_history.append({"role": "user", "parts": [{"text": request.message}]})
-        new_history.append({"role": "model", "parts": [{"text": response_text}]})
-            
-        session["chat_history"] = new_history
-        await save_session_data(x_session_id, session)
-        
+        with CHATS_IN_PROGRESS.track_inprogress():
+            client, chat_session = await open_chat(x_session_id, session, api_key)
+            history = list(chat_session.get_history(curated=True))
+
+            cached = get_answer(session_store_names(session), request.message, history)
+            if cached:
+                CHAT_ANSWERS.labels("cache").inc()
+                response_text = cached["response"]
+                record_turn(chat_session, request.message, response_text)
+            else:
+                try:
+                    with CHAT_GENERATION_SECONDS.labels("chat").time():
+                        response_text, grounding = await run_blocking(generate_answer, chat_session, request.message)
+                except Exception as e:
+                    print(f"Error generating response: {e}")
+                    CHAT_ANSWERS.labels("error").inc()
+                    response_text = f"An error occurred while generating the response: {str(e)}"
+                else:
+                    if response_text is None:
+                        CHAT_ANSWERS.labels("blocked").inc()
+                        response_text = BLOCKED_RESPONSE
+                    else:
+                        CHAT_ANSWERS.labels("model").inc()
+                        put_answer(session_store_names(session), request.message, history, response_text, grounding)
+
+            await finish_turn(x_session_id, session, api_key, client, chat_session, request.message, response_text, background_tasks)
+
         return {"response": response_text}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/chat/stream")
+async def chat_stream(request: ChatRequest, background_tasks: BackgroundTasks, x_session_id: str = Header(None), session: dict = Depends(current_session(*CHAT_SESSION_FIELDS))):
+    """
+    Streams the reply as NDJSON: {"status": "delta", "text"} events as tokens
+    arrive, then {"status": "complete", "response", "grounding_metadata"}.
+    The assembled turn is saved to history once the stream ends.
+    """
+    api_key = require_chat_ready(session)
+
+    try:
+        client, chat_session = await open_chat(x_session_id, session, api_key)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    history = list(chat_session.get_history(curated=True))
+    cached = get_answer(session_store_names(session), request.message, history)
+
+    async def generate_events():
+        with CHATS_IN_PROGRESS.track_inprogress():
+            async for line in stream_events():
+                yield line
+
+    async def stream_events():
+        if cached:
+            CHAT_ANSWERS.labels("cache").inc()
+            record_turn(chat_session, request.message, cached["response"])
+            await finish_turn(x_session_id, session, api_key, client, chat_session, request.message, cached["response"], background_tasks)
+            yield json.dumps({"status": "delta", "text": cached["response"]}) + "\n"
+            yield json.dumps({"status": "complete", "response": cached["response"], "grounding_metadata": cached["grounding_metadata"], "cached": True}) + "\n"
+            return
+
+        parts = []
+        grounding = None
+        started = time.perf_counter()
+        handed_back = False
+        try:
+            try:
+                async for kind, value in iterate_blocking(stream_response, chat_session, request.message):
+                    if kind == "delta":
+                        if not parts:
+                            CHAT_FIRST_TOKEN_SECONDS.observe(time.perf_counter() - started)
+                        parts.append(value)
+                        yield json.dumps({"status": "delta", "text": value}) + "\n"
+                    else:
+                        grounding = value
+            except Exception as e:
+                print(f"Error streaming response: {e}")
+                CHAT_ANSWERS.labels("error").inc()
+                # The failed turn was not recorded, so the chat can serve the next one
+                checkin_chat(x_session_id, session_store_names(session), api_key, client, chat_session)
+                handed_back = True
+                yield json.dumps({"status": "error", "message": f"An error occurred while generating the response: {str(e)}"}) + "\n"
+                return
+            CHAT_GENERATION_SECONDS.labels("stream").observe(time.perf_counter() - started)
+
+            response_text = "".join(parts)
+            if response_text:
+                CHAT_ANSWERS.labels("model").inc()
+                put_answer(session_store_names(session), request.message, history, response_text, grounding)
+            else:
+                CHAT_ANSWERS.labels("blocked").inc()
+                response_text = BLOCKED_RESPONSE
+            handed_back = True
+            await finish_turn(x_session_id, session, api_key, client, chat_session, request.message, response_text, background_tasks)
+            yield json.dumps({"status": "complete", "response": response_text, "grounding_metadata": grounding}) + "\n"
+        finally:
+            if not handed_back:
+                # The client went away mid-stream; the chat may still be in use by the
+                # stream's thread, so it is not reused. Closing also ends that stream.
+                close_client(client)
+
+    return StreamingResponse(generate_events(), media_type="application/x-ndjson")
+
+@router.post("/chat/batch")
+async def chat_batch(request: BatchChatRequest, session: dict = Depends(current_session(*CHAT_SESSION_FIELDS))):
+    """
+    Answers many independent questions, e.g. an evaluation set, each in a fresh
+    chat without history. The session's history is neither used nor changed.
+    Streams NDJSON in completion order: {"status": "answer", "index", "question",
+    "response", "grounding_metadata", "cached", "latency_ms"} or {"status": "error",
+    "index", "question", "message", "latency_ms"} per question, then
+    {"status": "complete", "answered", "failed", "seconds"}.
+    Questions run CHAT_BATCH_CONCURRENCY at a time on the background pool, so
+    the Gemini rate limiter keeps part of the key's quota for interactive chat.
+    """
+    api_key = require_chat_ready(session)
+    if not request.questions:
+        raise HTTPException(status_code=400, detail="No questions given.")
+    if len(request.questions) > CHAT_BATCH_MAX_QUESTIONS:
+        raise HTTPException(status_code=400, detail=f"At most {CHAT_BATCH_MAX_QUESTIONS} questions per batch.")
+
+    store_names = session_store_names(session)
+    if request.folder_key:
+        store_names = [entry["store_name"] for entry in session.get("stores", []) if entry.get("folder_key") == request.folder_key]
+        if not store_names:
+            raise HTTPException(status_code=404, detail="Store not found in this session")
+
+    try:
+        client = await run_bulk(get_client, api_key)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    slots = asyncio.Semaphore(CHAT_BATCH_CONCURRENCY)
+    stopped = asyncio.Event()
+
+    async def answer(index, question):
+        async with slots:
+            if stopped.is_set():
+                return None
+            started = time.perf_counter()
+            event = {"index": index, "question": question}
+            cached = get_answer(store_names, question, []) if request.use_cache else None
+            if cached:
+                CHAT_ANSWERS.labels("cache").inc()
+                event.update(status="answer", response=cached["response"], grounding_metadata=cached["grounding_metadata"], cached=True)
+            else:
+                try:
+                    chat_session = await run_bulk(create_chat_session, client, store_names)
+                    response_text, grounding = await run_bulk(generate_answer, chat_session, question)
+                except Exception as e:
+                    CHAT_ANSWERS.labels("error").inc()
+                    event.update(status="error", message=f"An error occurred while generating the response: {str(e)}")
+                else:
+                    CHAT_GENERATION_SECONDS.labels("batch").observe(time.perf_counter() - started)
+                    if response_text is None:
+                        CHAT_ANSWERS.labels("blocked").inc()
+                        response_text = BLOCKED_RESPONSE
+                    else:
+                        CHAT_ANSWERS.labels("model").inc()
+                        if request.use_cache:
+                            put_answer(store_names, question, [], response_text, grounding)
+                    event.update(status="answer", response=response_text, grounding_metadata=grounding, cached=False)
+            event["latency_ms"] = round((time.perf_counter() - started) * 1000, 1)
+            return event
+
+    async def generate_events():
+        started = time.perf_counter()
+        tasks = [asyncio.create_task(answer(index, question)) for index, question in enumerate(request.questions)]
+        counts = {"answer": 0, "error": 0}
+        try:
+            with CHATS_IN_PROGRESS.track_inprogress():
+                for next_done in asyncio.as_completed(tasks):
+                    event = await next_done
+                    counts[event["status"]] += 1
+                    yield json.dumps(event) + "\n"
+            yield json.dumps({"status": "complete", "answered": counts["answer"], "failed": counts["error"],
+                              "seconds": round(time.perf_counter() - started, 3)}) + "\n"
+        finally:
+            # The client went away: don't spend quota on answers nobody reads. Cancelling
+            # would not stop calls already running in executor threads, so let those
+            # finish and close the genai client after them.
+            stopped.set()
+            asyncio.gather(*tasks, return_exceptions=True).add_done_callback(lambda _: close_client(client))
+
+    return StreamingResponse(generate_events(), media_type="application/x-ndjson")
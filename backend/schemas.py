@@ -5,12 +5,29 @@ class DriveItem(BaseModel):
     id: str
     name: str
     mimeType: str
+    # As listed by /api/drive/list; lets sync plan and skip unchanged files
+    size: Optional[str] = None
+    md5Checksum: Optional[str] = None
+    modifiedTime: Optional[str] = None
 
 class SyncRequest(BaseModel):
     items: List[DriveItem]
+    # Re-index only added/changed files into the existing store
+    incremental: bool = False
+    # Chat over this selection alongside the session's other stores instead of replacing them
+    add: bool = False
+    # Label for the selection's store; defaults to the names of the selected items
+    name: Optional[str] = None
 
 class ChatRequest(BaseModel):
     message: str
 
+class BatchChatRequest(BaseModel):
+    questions: List[str]
+    # Only search this synced selection's store (see /api/chat/stores); default all of the session's stores
+    folder_key: Optional[str] = None
+    # Answer from, and fill, the answer cache
+    use_cache: bool = True
+
 class ApiKeyRequest(BaseModel):
     api_key: str
@@ -0,0 +1,44 @@
+from config import ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL_SECONDS
+from services.cache import TTLCache
+from services.metrics import register_cache
+import hashlib
+import re
+
+# Answers keyed by (store names, normalized question, history fingerprint).
+# Re-syncing a store drops all answers drawn from it.
+_answers = TTLCache(maxsize=ANSWER_CACHE_SIZE, ttl=ANSWER_CACHE_TTL_SECONDS)
+register_cache("answers", _answers)
+
+def normalize_question(question):
+    question = re.sub(r"\s+", " ", question.strip().lower())
+    return question.rstrip("?!. ")
+
+def history_fingerprint(history):
+    """
+    Stable hash of a chat history (list of genai Content).
+    """
+    digest = hashlib.sha256()
+    for content in history:
+        digest.update((content.role or "").encode())
+        for part in content.parts or []:
+            digest.update(b"\0" + (part.text or "").encode())
+        digest.update(b"\1")
+    return digest.hexdigest()
+
+def _key(store_names, question, history):
+    return (tuple(sorted(store_names)), normalize_question(question), history_fingerprint(history))
+
+def get_answer(store_names, question, history):
+    """
+    Returns the cached {"response", "grounding_metadata"} or None.
+    """
+    return _answers.get(_key(store_names, question, history))
+
+def put_answer(store_names, question, history, response, grounding_metadata=None):
+    _answers.set(_key(store_names, question, history), {"response": response, "grounding_metadata": grounding_metadata})
+
+def invalidate_store(store_name):
+    _answers.invalidate(lambda key: store_name in key[0])
+
+def stats():
+    return {"hits": _answers.hits, "misses": _answers.misses, "size": len(_answers)}
@@ -0,0 +1,101 @@
+import threading
+import time
+from collections import OrderedDict
+
+class TTLCache:
+    """
+    Thread-safe LRU cache whose entries also expire `ttl` seconds after being set.
+    `on_evict(key, value)` is called for entries dropped by size, age or invalidation.
+    """
+
+    def __init__(self, maxsize, ttl, on_evict=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.on_evict = on_evict
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _evict(self, items):
+        if self.on_evict:
+            for key, value in items:
+                try:
+                    self.on_evict(key, value)
+                except Exception as e:
+                    print(f"Cache eviction callback failed: {e}")
+
+    def get(self, key, default=None):
+        expired = []
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                expired.append((key, self._data.pop(key)[1]))
+                entry = None
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._data.move_to_end(key)
+        self._evict(expired)
+        return default if entry is None else entry[1]
+
+    def set(self, key, value, ttl=None):
+        evicted = []
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None and old[1] is not value:
+                evicted.append((key, old[1]))
+            self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+            while len(self._data) > self.maxsize:
+                evicted.append(self._pop_oldest())
+        self._evict(evicted)
+
+    def _pop_oldest(self):
+        key, (_, value) = self._data.popitem(last=False)
+        return key, value
+
+    def pop(self, key, default=None):
+        """
+        Removes and returns a live entry without calling on_evict (the caller takes ownership).
+        """
+        with self._lock:
+            entry = self._data.pop(key, None)
+            live = entry is not None and entry[0] >= time.monotonic()
+            if live:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if not live:
+            if entry is not None:
+                self._evict([(key, entry[1])])
+            return default
+        return entry[1]
+
+    def discard(self, key):
+        """
+        Drops a single entry, if present.
+        """
+        with self._lock:
+            entry = self._data.pop(key, None)
+        if entry is not None:
+            self._evict([(key, entry[1])])
+
+    def invalidate(self, predicate):
+        """
+        Drops every entry whose key matches `predicate(key)`.
+        """
+        with self._lock:
+            keys = [key for key in self._data if predicate(key)]
+            evicted = [(key, self._data.pop(key)[1]) for key in keys]
+        self._evict(evicted)
+        return len(evicted)
+
+    def clear(self):
+        with self._lock:
+            evicted = [(key, value) for key, (_, value) in self._data.items()]
+            self._data.clear()
+        self._evict(evicted)
+
+    def __len__(self):
+        return len(self._data)
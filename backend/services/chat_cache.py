@@ -0,0 +1,38 @@
+from config import CHAT_CACHE_SIZE, CHAT_CACHE_TTL_SECONDS
+from services.cache import TTLCache
+from services.metrics import register_cache
+
+# Live genai clients and chat objects keyed by (session_id, store names), so warm
+# turns skip client construction, TLS handshakes and history replay.
+
+def _close(key, entry):
+    try:
+        entry["client"].close()
+    except Exception:
+        pass
+
+_chats = TTLCache(maxsize=CHAT_CACHE_SIZE, ttl=CHAT_CACHE_TTL_SECONDS, on_evict=_close)
+register_cache("chats", _chats)
+
+def _key(session_id, store_names):
+    return (session_id, tuple(sorted(store_names)))
+
+def checkout_chat(session_id, store_names, api_key):
+    """
+    Takes the cached entry ({"client", "chat", "api_key"}) out of the cache so
+    concurrent requests never share a chat object. Returns None on a miss.
+    """
+    entry = _chats.pop(_key(session_id, store_names))
+    if entry is not None and entry["api_key"] != api_key:
+        _close(None, entry)
+        return None
+    return entry
+
+def checkin_chat(session_id, store_names, api_key, client, chat):
+    _chats.set(_key(session_id, store_names), {"client": client, "chat": chat, "api_key": api_key})
+
+def invalidate_session(session_id):
+    """
+    Drops every cached chat for the session, e.g. after a new sync or API key.
+    """
+    _chats.invalidate(lambda key: key[0] == session_id)
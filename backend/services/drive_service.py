@@ -1,82 +1,289 @@
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseDownload
-from google.oauth2.credentials import Credentials
-import io
-import os
-
-def get_drive_service(credentials_data):
-    creds = Credentials(
-        token=credentials_data["token"],
-        refresh_token=credentials_data["refresh_token"],
-        token_uri=credentials_data["token_uri"],
-        client_id=credentials_data["client_id"],
-        client_secret=credentials_data["client_secret"],
-        scopes=credentials_data["scopes"]
-    )
-    return build('drive', 'v3', credentials=creds)
-
-def list_files_in_folder(service, folder_id):
-    """
-    Recursively list all files in a folder.
-    Returns a list of file objects with id, name, mimeType.
-    """
-    files = []
-    page_token = None
-    
-    query = f"'{folder_id}' in parents and trashed = false"
-    
-    while True:
-        results = service.files().list(
-            q=query,
-            pageSize=100,
-            fields="nextPageToken, files(id, name, mimeType)",
+from services.google_api import credentials_key, pooled_service, get_discovery_document
+from services.rate_limiter import drive_limiter
+from collections import deque
+from config import DRIVE_CRAWL_BATCH_SIZE, DRIVE_CRAWL_CONCURRENCY, DRIVE_DOWNLOAD_CHUNK_SIZE, DRIVE_SPOOL_MAX_BYTES
+from services.executor import run_bulk
+from services.metrics import DRIVE_LIST_SECONDS, DRIVE_DOWNLOAD_SECONDS, DRIVE_DOWNLOAD_BYTES, TEMP_FILE_WRITE_SECONDS
+import asyncio
+import tempfile
+import time
+
+def pooled_drive_service(credentials_data):
+    """
+    Context manager checking a ready Drive service out of the shared pool.
+    Requests are rate limited per Drive user and retried when throttled.
+    """
+    return pooled_service('drive', 'v3', credentials_data, limiter=drive_limiter(credentials_key(credentials_data)))
+
+FOLDER_MIME_TYPE = 'application/vnd.google-apps.folder'
+SHORTCUT_MIME_TYPE = 'application/vnd.google-apps.shortcut'
+
+CRAWL_FIELDS = "nextPageToken, files(id, name, mimeType, size, md5Checksum, modifiedTime, shortcutDetails(targetId, targetMimeType))"
+
+def _list_folders_page(service, folder_ids, page_token=None):
+    """
+    Fetch one page of the children of several folders with a single query.
+    """
+    parents = " or ".join(f"'{folder_id}' in parents" for folder_id in folder_ids)
+    with DRIVE_LIST_SECONDS.time():
+        return service.files().list(
+            q=f"({parents}) and trashed = false",
+            pageSize=1000,
+            fields=CRAWL_FIELDS,
             pageToken=page_token
         ).execute()
-        
-        items = results.get('files', [])
-        
-        for item in items:
-            if item['mimeType'] == 'application/vnd.google-apps.folder':
-                # Recursively list subfolder
-                files.extend(list_files_in_folder(service, item['id']))
-            else:
-                files.append(item)
-        
+
+def _get_target_metadata(service, file_id):
+    """
+    Metadata of a shortcut's target, which the listing of the shortcut lacks.
+    """
+    return service.files().get(fileId=file_id, fields="size, md5Checksum, modifiedTime").execute()
+
+async def crawl_files(credentials_data, folder_ids, batch_size=DRIVE_CRAWL_BATCH_SIZE, concurrency=DRIVE_CRAWL_CONCURRENCY):
+    """
+    Breadth-first crawl of one or more folders.
+    Batches up to `batch_size` folders per files().list query and keeps up to
+    `concurrency` pages in flight. Shortcuts are resolved to their targets (a
+    files.get per file target, for its metadata) and every folder and file is
+    visited at most once, so cycles terminate.
+    Yields file objects with id, name, mimeType, size (bytes, as an int),
+    md5Checksum and modifiedTime (when Drive reports them) as soon as they are listed.
+    """
+    visited_folders = set(folder_ids)
+    seen_files = set()
+    pending = deque(folder_ids)
+    pending_targets = deque()
+    in_flight = set()
+
+    async def fetch(batch, page_token):
+        # googleapiclient services are not thread-safe: check one out per request.
+        with pooled_drive_service(credentials_data) as service:
+            return batch, await run_bulk(_list_folders_page, service, batch, page_token)
+
+    async def fetch_target(item):
+        # Handed back as a one-file page so it goes through the same path as listed files
+        with pooled_drive_service(credentials_data) as service:
+            try:
+                metadata = await run_bulk(_get_target_metadata, service, item['id'])
+            except Exception as e:
+                print(f"Could not read shortcut target {item['name']}: {e}")
+                metadata = {}
+        return None, {"files": [{**metadata, **item}]}
+
+    try:
+        while pending or pending_targets or in_flight:
+            while pending_targets and len(in_flight) < concurrency:
+                in_flight.add(asyncio.ensure_future(fetch_target(pending_targets.popleft())))
+            while pending and len(in_flight) < concurrency:
+                batch = [pending.popleft() for _ in range(min(batch_size, len(pending)))]
+                in_flight.add(asyncio.ensure_future(fetch(batch, None)))
+
+            done, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+
+            for task in done:
+                batch, results = task.result()
+
+                page_token = results.get('nextPageToken')
+                if page_token:
+                    in_flight.add(asyncio.ensure_future(fetch(batch, page_token)))
+
+                for item in results.get('files', []):
+                    if item['mimeType'] == SHORTCUT_MIME_TYPE:
+                        details = item.get('shortcutDetails') or {}
+                        if not details.get('targetId'):
+                            continue
+                        item = {
+                            "id": details['targetId'],
+                            "name": item['name'],
+                            "mimeType": details.get('targetMimeType', '')
+                        }
+                        if item['mimeType'] != FOLDER_MIME_TYPE:
+                            # Size, checksum and modifiedTime come from the target itself
+                            if item['id'] not in seen_files:
+                                seen_files.add(item['id'])
+                                pending_targets.append(item)
+                            continue
+
+                    if item['mimeType'] == FOLDER_MIME_TYPE:
+                        if item['id'] not in visited_folders:
+                            visited_folders.add(item['id'])
+                            pending.append(item['id'])
+                    elif item['id'] not in seen_files or batch is None: # Targets are marked seen when queued
+                        seen_files.add(item['id'])
+                        yield {
+                            "id": item['id'],
+                            "name": item['name'],
+                            "mimeType": item['mimeType'],
+                            "size": int(item['size']) if item.get('size') else None,
+                            "md5Checksum": item.get('md5Checksum'),
+                            "modifiedTime": item.get('modifiedTime')
+                        }
+    finally:
+        for task in in_flight:
+            task.cancel()
+
+def get_start_page_token(service):
+    """
+    Returns the Changes API cursor for the current state of the user's Drive.
+    """
+    return service.changes().getStartPageToken().execute()['startPageToken']
+
+def list_changed_file_ids(service, page_token):
+    """
+    Returns the ids of all files changed or removed since `page_token`.
+    """
+    changed = set()
+    while page_token:
+        results = service.changes().list(
+            pageToken=page_token,
+            pageSize=1000,
+            fields="nextPageToken, newStartPageToken, changes(fileId)"
+        ).execute()
+        changed.update(change['fileId'] for change in results.get('changes', []) if change.get('fileId'))
         page_token = results.get('nextPageToken')
-        if not page_token:
-            break
-            
-    return files
+    return changed
 
-def list_children(service, folder_id):
+def list_children(service, folder_id, page_token=None, page_size=100):
     """
-    List direct children of a folder (non-recursive).
+    List one page of the direct children of a folder (non-recursive).
+    Returns (files, next_page_token).
     """
-    results = service.files().list(
-        q=f"'{folder_id}' in parents and trashed = false",
-        pageSize=100,
-        fields="nextPageToken, files(id, name, mimeType, iconLink)",
-        orderBy="folder,name"
-    ).execute()
+    with DRIVE_LIST_SECONDS.time():
+        results = service.files().list(
+            q=f"'{folder_id}' in parents and trashed = false",
+            pageSize=page_size,
+            fields="nextPageToken, files(id, name, mimeType, iconLink, size, md5Checksum, modifiedTime)",
+            orderBy="folder,name",
+            pageToken=page_token
+        ).execute()
     
-    return results.get('files', [])
-
-def download_file(service, file_id, mime_type):
-    """
-    Download a file. If it's a Google Doc, export as PDF.
-    Returns the file content as bytes.
-    """
-    if mime_type.startswith('application/vnd.google-apps.'):
-        # Export Google Docs/Sheets/Slides as PDF
-        request = service.files().export_media(fileId=file_id, mimeType='application/pdf')
-    else:
-        # Download binary files
-        request = service.files().get_media(fileId=file_id)
-        
-    fh = io.BytesIO()
-    downloader = MediaIoBaseDownload(fh, request)
-    done = False
-    while done is False:
-        status, done = downloader.next_chunk()
-        
-    return fh.getvalue()
+    return results.get('files', []), results.get('nextPageToken')
+
+def get_modified_time(service, file_id):
+    return service.files().get(fileId=file_id, fields="modifiedTime").execute().get('modifiedTime')
+
+class _TimedWriter:
+    """
+    File wrapper adding up the time and bytes spent in write().
+    """
+
+    def __init__(self, fh):
+        self._fh = fh
+        self.seconds = 0.0
+        self.bytes = 0
+
+    def write(self, data):
+        started = time.perf_counter()
+        written = self._fh.write(data)
+        self.seconds += time.perf_counter() - started
+        self.bytes += len(data)
+        return written
+
+# Export formats tried in order for each Google Workspace type, as
+# (export format, MIME type to upload the result as). Text keeps what File
+# Search indexes at a fraction of the size of a PDF; PDF is the fallback for
+# every type, including ones not listed here.
+SHEETS_CSV_EXPORT = 'text/csv; per sheet'
+PDF_EXPORT = ('application/pdf', 'application/pdf')
+WORKSPACE_EXPORTS = {
+    'application/vnd.google-apps.document': [('text/markdown', 'text/plain'), ('text/plain', 'text/plain')],
+    # Every sheet through the Sheets API; Drive's own CSV export (first sheet only) if that API is off
+    'application/vnd.google-apps.spreadsheet': [(SHEETS_CSV_EXPORT, 'text/plain'), ('text/csv', 'text/plain')],
+    'application/vnd.google-apps.presentation': [('text/plain', 'text/plain')],
+}
+
+def download_file(service, file_id, mime_type, chunk_size=DRIVE_DOWNLOAD_CHUNK_SIZE):
+    """
+    Download a file into a spooled temporary file, rewound and ready to read:
+    files up to DRIVE_SPOOL_MAX_BYTES stay in memory, larger ones spill to an
+    anonymous temp file that disappears when closed. Google Workspace files are
+    exported in the first format of WORKSPACE_EXPORTS that works, falling back
+    to PDF. The content is streamed `chunk_size` bytes at a time.
+    Returns (file, MIME type to upload it as); the caller must close the file.
+    """
+    if not mime_type.startswith('application/vnd.google-apps.'):
+        return _download(service.files().get_media(fileId=file_id), chunk_size), mime_type
+
+    formats = WORKSPACE_EXPORTS.get(mime_type, []) + [PDF_EXPORT]
+    for export_format, upload_mime_type in formats:
+        try:
+            if export_format == SHEETS_CSV_EXPORT:
+                fh = _export_sheets_csv(service, file_id)
+            else:
+                fh = _download(service.files().export_media(fileId=file_id, mimeType=export_format), chunk_size)
+        except Exception as e:
+            if (export_format, upload_mime_type) == PDF_EXPORT:
+                raise
+            print(f"Exporting {file_id} as {export_format} failed, trying the next format: {e}")
+            continue
+
+        if _is_empty(fh) and (export_format, upload_mime_type) != PDF_EXPORT:
+            # e.g. slides with images only: nothing to index as text
+            fh.close()
+            continue
+        return fh, upload_mime_type
+
+def _is_empty(fh):
+    empty = fh.seek(0, 2) == 0
+    fh.seek(0)
+    return empty
+
+def _spool():
+    return tempfile.SpooledTemporaryFile(max_size=DRIVE_SPOOL_MAX_BYTES, prefix="drive_")
+
+def _download(request, chunk_size):
+    from googleapiclient.http import MediaIoBaseDownload
+
+    fh = _spool()
+    writer = _TimedWriter(fh)
+    try:
+        with DRIVE_DOWNLOAD_SECONDS.time():
+            downloader = MediaIoBaseDownload(writer, request, chunksize=chunk_size)
+            done = False
+            while done is False:
+                status, done = downloader.next_chunk()
+    except Exception:
+        fh.close()
+        raise
+    finally:
+        DRIVE_DOWNLOAD_BYTES.inc(writer.bytes)
+    TEMP_FILE_WRITE_SECONDS.observe(writer.seconds)
+
+    fh.seek(0)
+    return fh
+
+def _export_sheets_csv(service, file_id):
+    """
+    Drive only exports the first sheet of a spreadsheet as CSV, so this lists
+    the sheets with the Sheets API and fetches each one's CSV export, writing
+    them one after another under a heading with the sheet's title.
+    Uses the Drive service's authorized transport (same credentials and thread).
+    """
+    from googleapiclient.discovery import build_from_document
+
+    http = service._http
+    sheets = build_from_document(get_discovery_document('sheets', 'v4'), http=http)
+    spreadsheet = sheets.spreadsheets().get(spreadsheetId=file_id, fields="sheets.properties(sheetId,title)").execute()
+
+    fh = _spool()
+    writer = _TimedWriter(fh)
+    try:
+        with DRIVE_DOWNLOAD_SECONDS.time():
+            for sheet in spreadsheet.get('sheets', []):
+                properties = sheet['properties']
+                url = f"https://docs.google.com/spreadsheets/d/{file_id}/export?format=csv&gid={properties['sheetId']}"
+                response, content = http.request(url, "GET")
+                if response.status != 200:
+                    raise RuntimeError(f"CSV export of sheet {properties['title']!r} failed with HTTP {response.status}")
+                writer.write(f"## Sheet: {properties['title']}\n".encode())
+                writer.write(content)
+                writer.write(b"\n\n")
+    except Exception:
+        fh.close()
+        raise
+    finally:
+        DRIVE_DOWNLOAD_BYTES.inc(writer.bytes)
+    TEMP_FILE_WRITE_SECONDS.observe(writer.seconds)
+
+    fh.seek(0)
+    return fh
@@ -0,0 +1,72 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import threading
+from config import BLOCKING_POOL_SIZE, BULK_POOL_SIZE
+
+# The Drive and Gemini SDKs are synchronous. Every call into them from a request
+# handler goes through this pool so a long download, upload or indexing wait
+# never stalls the event loop (and with it /health and other sessions' chats).
+_executor = ThreadPoolExecutor(max_workers=BLOCKING_POOL_SIZE, thread_name_prefix="blocking")
+# Syncs and other background work get their own pool: however much of it is
+# queued, interactive calls (chat above all) find free threads in _executor.
+BULK_THREAD_PREFIX = "bulk"
+_bulk_executor = ThreadPoolExecutor(max_workers=BULK_POOL_SIZE, thread_name_prefix=BULK_THREAD_PREFIX)
+
+async def run_blocking(func, *args, **kwargs):
+    """
+    Runs a blocking callable in the shared thread pool and awaits its result.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, partial(func, *args, **kwargs))
+
+async def run_bulk(func, *args, **kwargs):
+    """
+    Like run_blocking, for sync and background work (see _bulk_executor).
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_bulk_executor, partial(func, *args, **kwargs))
+
+def in_bulk_thread():
+    """
+    True when called from a run_bulk thread; rate limiters give these calls lower priority.
+    """
+    return threading.current_thread().name.startswith(BULK_THREAD_PREFIX)
+
+async def iterate_blocking(func, *args, **kwargs):
+    """
+    Runs a blocking generator function in the shared thread pool and yields
+    its items on the event loop as they are produced.
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    stopped = threading.Event()
+    done = object()
+
+    def produce():
+        try:
+            for item in func(*args, **kwargs):
+                if stopped.is_set():
+                    break
+                loop.call_soon_threadsafe(queue.put_nowait, (item, None))
+        except BaseException as e:
+            loop.call_soon_threadsafe(queue.put_nowait, (done, e))
+        else:
+            loop.call_soon_threadsafe(queue.put_nowait, (done, None))
+
+    loop.run_in_executor(_executor, produce)
+    try:
+        while True:
+            item, error = await queue.get()
+            if item is done:
+                if error:
+                    raise error
+                return
+            yield item
+    finally:
+        # Consumer went away early: let the worker thread stop at the next item.
+        stopped.set()
+
+def shutdown():
+    _executor.shutdown(wait=False, cancel_futures=True)
+    _bulk_executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,51 @@
+import asyncio
+import time
+from config import DRIVE_LIST_CACHE_SIZE, DRIVE_LIST_CACHE_FRESH_SECONDS, DRIVE_LIST_CACHE_MAX_AGE_SECONDS
+from services.cache import TTLCache
+from services.metrics import register_cache
+from services.drive_service import pooled_drive_service, list_children, get_modified_time
+from services.executor import run_blocking
+from services.google_api import credentials_key
+
+# Pages of folder listings per (user, folder, page). Within the fresh window a
+# page is served locally; after that it is revalidated with a cheap
+# files.get(modifiedTime) and only re-listed if the folder changed. A page not
+# in the cache is listed straight away.
+_listings = TTLCache(maxsize=DRIVE_LIST_CACHE_SIZE, ttl=DRIVE_LIST_CACHE_MAX_AGE_SECONDS)
+register_cache("drive_listings", _listings)
+
+async def _drive_call(credentials_data, func, *args):
+    with pooled_drive_service(credentials_data) as service:
+        return await run_blocking(func, service, *args)
+
+async def list_folder_page(credentials_data, folder_id, page_token=None, page_size=100):
+    """
+    Returns {"files", "nextPageToken"} for one page of a folder.
+    """
+    key = (credentials_key(credentials_data), folder_id, page_token, page_size)
+    entry = _listings.get(key)
+    now = time.monotonic()
+    if entry and entry["fresh_until"] > now:
+        return entry["page"]
+
+    if entry:
+        with pooled_drive_service(credentials_data) as service:
+            modified_time = await run_blocking(get_modified_time, service, folder_id)
+            if modified_time and modified_time == entry["modified_time"]:
+                entry["fresh_until"] = now + DRIVE_LIST_CACHE_FRESH_SECONDS
+                return entry["page"]
+            files, next_page_token = await run_blocking(list_children, service, folder_id, page_token, page_size)
+    else:
+        # Nothing to revalidate: fetch the modifiedTime for next time alongside the listing
+        modified_time, (files, next_page_token) = await asyncio.gather(
+            _drive_call(credentials_data, get_modified_time, folder_id),
+            _drive_call(credentials_data, list_children, folder_id, page_token, page_size)
+        )
+
+    page = {"files": files, "nextPageToken": next_page_token}
+    _listings.set(key, {
+        "page": page,
+        "modified_time": modified_time,
+        "fresh_until": now + DRIVE_LIST_CACHE_FRESH_SECONDS
+    })
+    return page
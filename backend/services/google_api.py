@@ -0,0 +1,76 @@
+from config import GOOGLE_SERVICE_POOL_USERS, GOOGLE_SERVICE_POOL_PER_USER, GOOGLE_SERVICE_POOL_TTL_SECONDS
+from services.cache import TTLCache
+from services.metrics import register_cache
+from services.rate_limiter import ThrottledHttp
+from contextlib import contextmanager
+from functools import lru_cache
+import hashlib
+import json
+import threading
+
+@lru_cache(maxsize=None)
+def get_discovery_document(api, version):
+    """
+    Parsed discovery document from the copy bundled with google-api-python-client,
+    loaded once per process instead of on every build().
+    """
+    from googleapiclient.discovery_cache import get_static_doc
+
+    document = get_static_doc(api, version)
+    if document is None:
+        raise ValueError(f"No bundled discovery document for {api} {version}")
+    return json.loads(document)
+
+def build_service(api, version, credentials):
+    from googleapiclient.discovery import build_from_document
+
+    return build_from_document(get_discovery_document(api, version), credentials=credentials)
+
+def credentials_from_data(credentials_data):
+    from google.oauth2.credentials import Credentials
+
+    return Credentials(
+        token=credentials_data["token"],
+        refresh_token=credentials_data["refresh_token"],
+        token_uri=credentials_data["token_uri"],
+        client_id=credentials_data["client_id"],
+        client_secret=credentials_data["client_secret"],
+        scopes=credentials_data["scopes"]
+    )
+
+# Idle service objects per (api, version, credential). Each one owns its own
+# authorized HTTP transport, so reusing them also reuses TLS connections and
+# refreshed access tokens. Services are not thread-safe: callers check one
+# out for the duration of a call and return it afterwards.
+_idle_services = TTLCache(maxsize=GOOGLE_SERVICE_POOL_USERS, ttl=GOOGLE_SERVICE_POOL_TTL_SECONDS)
+register_cache("google_services", _idle_services)
+_pool_lock = threading.Lock()
+
+def credentials_key(credentials_data):
+    secret = credentials_data.get("refresh_token") or credentials_data.get("token") or ""
+    return hashlib.sha256(f"{credentials_data.get('client_id')}:{secret}".encode()).hexdigest()
+
+@contextmanager
+def pooled_service(api, version, credentials_data, limiter=None):
+    """
+    Context manager yielding a ready service object for the given credentials.
+    Services built with a `limiter` (services.rate_limiter) send every request through it.
+    """
+    key = (api, version, credentials_key(credentials_data))
+    with _pool_lock:
+        idle = _idle_services.get(key)
+        service = idle.pop() if idle else None
+
+    if service is None:
+        service = build_service(api, version, credentials_from_data(credentials_data))
+        if limiter is not None:
+            service._http = ThrottledHttp(service._http, limiter)
+
+    try:
+        yield service
+    finally:
+        with _pool_lock:
+            idle = _idle_services.get(key) or []
+            if len(idle) < GOOGLE_SERVICE_POOL_PER_USER:
+                idle.append(service)
+            _idle_services.set(key, idle)
@@ -0,0 +1,160 @@
+from database import db
+from config import CHAT_CONTEXT_POLICY, CHAT_HISTORY_MAX_TURNS, CHAT_HISTORY_TOKEN_BUDGET, CHAT_SUMMARY_BATCH_TURNS
+from services.executor import run_bulk
+from services.session_service import invalidate_session_cache
+from datetime import datetime
+
+# Chat turns live in their own collection, one document per message, so a turn
+# is an insert rather than a rewrite of an ever-growing array on the session.
+
+def _to_content(message):
+    return {"role": message["role"], "parts": [{"text": message["text"]}]}
+
+def _estimate_tokens(text):
+    # Rough heuristic (~4 characters per token); good enough for budgeting.
+    return len(text) // 4 + 1
+
+async def append_turn(session_id: str, user_text: str, model_text: str):
+    database = db.get_db()
+    now = datetime.utcnow()
+    await database.chat_turns.insert_many([
+        {"session_id": session_id, "role": "user", "text": user_text, "created_at": now},
+        {"session_id": session_id, "role": "model", "text": model_text, "created_at": now}
+    ])
+
+async def clear_history(session_id: str, session: dict = None):
+    """
+    Deletes the session's turns and summary. Pass the in-memory `session` about
+    to be saved so the cleared fields are not written back.
+    """
+    if session is not None:
+        for key in ("chat_summary", "chat_summary_upto", "chat_history"):
+            session.pop(key, None)
+
+    database = db.get_db()
+    await database.chat_turns.delete_many({"session_id": session_id})
+    await database.sessions.update_one(
+        {"session_id": session_id},
+        {"$unset": {"chat_summary": "", "chat_summary_upto": "", "chat_history": ""}}
+    )
+    invalidate_session_cache(session_id)
+
+async def _recent_messages(session_id: str, limit: int):
+    database = db.get_db()
+    cursor = database.chat_turns.find({"session_id": session_id}).sort("_id", -1).limit(limit)
+    messages = await cursor.to_list(length=limit)
+    messages.reverse()
+    return messages
+
+def _summary_context_messages():
+    # A fold runs once this many messages are unsummarized, leaving the last window
+    return (CHAT_HISTORY_MAX_TURNS + CHAT_SUMMARY_BATCH_TURNS) * 2
+
+async def _adopt_legacy_history(session_id: str, session: dict):
+    """
+    Moves a session's `chat_history` array (from before turns had their own
+    collection) into chat_turns. Unsetting it first means only one request
+    moves it.
+    """
+    session.pop("chat_history", None)
+    database = db.get_db()
+    legacy = await database.sessions.find_one_and_update(
+        {"session_id": session_id, "chat_history": {"$exists": True}},
+        {"$unset": {"chat_history": ""}},
+        projection={"chat_history": 1}
+    )
+    invalidate_session_cache(session_id)
+    if not legacy:
+        return
+
+    now = datetime.utcnow()
+    turns = [
+        {"session_id": session_id, "role": message["role"],
+         "text": "".join(part.get("text") or "" for part in message.get("parts", [])), "created_at": now}
+        for message in legacy.get("chat_history") or []
+    ]
+    if turns:
+        await database.chat_turns.insert_many(turns)
+
+async def load_context(session_id: str, session: dict, policy=CHAT_CONTEXT_POLICY):
+    """
+    Returns the history to send to the model for the next turn, bounded by the
+    configured context policy rather than by the length of the conversation.
+    """
+    if "chat_history" in session:
+        await _adopt_legacy_history(session_id, session)
+
+    if policy == "tokens":
+        database = db.get_db()
+        selected = []
+        budget = CHAT_HISTORY_TOKEN_BUDGET
+        cursor = database.chat_turns.find({"session_id": session_id}).sort("_id", -1)
+        async for message in cursor:
+            budget -= _estimate_tokens(message["text"])
+            if budget < 0:
+                break
+            selected.append(message)
+        selected.reverse()
+        # Never start the context on a model reply.
+        if selected and selected[0]["role"] == "model":
+            selected = selected[1:]
+        return [_to_content(m) for m in selected]
+
+    if policy == "summary":
+        # Every turn not yet folded into the summary, so none falls between the
+        # window and the summary while a batch builds up (see update_summary).
+        database = db.get_db()
+        query = {"session_id": session_id}
+        if session.get("chat_summary_upto"):
+            query["_id"] = {"$gt": session["chat_summary_upto"]}
+        limit = _summary_context_messages()
+        messages = await database.chat_turns.find(query).sort("_id", -1).limit(limit).to_list(length=limit)
+        messages.reverse()
+    else:
+        messages = await _recent_messages(session_id, CHAT_HISTORY_MAX_TURNS * 2)
+    history = [_to_content(m) for m in messages]
+
+    if policy == "summary" and session.get("chat_summary"):
+        history = [
+            {"role": "user", "parts": [{"text": f"Summary of our earlier conversation:\n{session['chat_summary']}"}]},
+            {"role": "model", "parts": [{"text": "Understood, I will keep that in mind."}]}
+        ] + history
+
+    return history
+
+def fits_context(history, policy=CHAT_CONTEXT_POLICY):
+    """
+    Whether a live chat's history (list of genai Content) is still within the
+    context policy, i.e. can keep being used instead of being rebuilt.
+    """
+    if policy == "tokens":
+        total = sum(_estimate_tokens(part.text or "") for content in history for part in (content.parts or []))
+        return total <= CHAT_HISTORY_TOKEN_BUDGET
+    if policy == "summary":
+        return len(history) <= _summary_context_messages() + 2
+    return len(history) <= CHAT_HISTORY_MAX_TURNS * 2
+
+async def update_summary(session_id: str, session: dict, summarize):
+    """
+    Folds turns that have dropped out of the window into the session's rolling summary.
+    `summarize(previous_summary, messages)` is a blocking callable returning the new summary.
+    Runs only once a full batch has accumulated, so it reads at most window + batch turns.
+    """
+    database = db.get_db()
+    query = {"session_id": session_id}
+    if session.get("chat_summary_upto"):
+        query["_id"] = {"$gt": session["chat_summary_upto"]}
+
+    limit = _summary_context_messages()
+    unsummarized = await database.chat_turns.find(query).sort("_id", 1).limit(limit).to_list(length=limit)
+    if len(unsummarized) < limit:
+        return
+
+    older = unsummarized[:CHAT_SUMMARY_BATCH_TURNS * 2]
+    summary = await run_bulk(summarize, session.get("chat_summary"), [_to_content(m) for m in older])
+
+    await database.sessions.update_one(
+        {"session_id": session_id},
+        {"$set": {"chat_summary": summary, "chat_summary_upto": older[-1]["_id"]}}
+    )
+    invalidate_session_cache(session_id)
@@ -0,0 +1,54 @@
+from database import db
+
+# One document per (File Search store, Drive file) listing what is indexed in
+# the store and under which document name, so re-syncs can add, replace or
+# remove individual documents instead of rebuilding the store.
+
+async def get_manifest(store_name: str):
+    """
+    Returns the store's manifest as a dict keyed by Drive file id.
+    """
+    database = db.get_db()
+    entries = {}
+    async for entry in database.sync_manifests.find({"store_name": store_name}, {"_id": 0}):
+        entries[entry["file_id"]] = entry
+    return entries
+
+async def save_manifest_entry(store_name: str, entry: dict):
+    database = db.get_db()
+    await database.sync_manifests.update_one(
+        {"store_name": store_name, "file_id": entry["file_id"]},
+        {"$set": {**entry, "store_name": store_name}, "$unset": {"pending_operation": ""}},
+        upsert=True
+    )
+
+async def mark_pending(store_name: str, file_id: str, name: str, operation_name: str):
+    """
+    Records an upload still being indexed, so that if the sync is interrupted
+    before the entry is saved, the next run can find the document it left behind.
+    """
+    database = db.get_db()
+    await database.sync_manifests.update_one(
+        {"store_name": store_name, "file_id": file_id},
+        {"$set": {"pending_operation": operation_name}, "$setOnInsert": {"name": name}},
+        upsert=True
+    )
+
+async def clear_pending(store_name: str, file_id: str):
+    """
+    Forgets a pending upload; entries for files that were never indexed go with it.
+    """
+    database = db.get_db()
+    await database.sync_manifests.update_one(
+        {"store_name": store_name, "file_id": file_id},
+        {"$unset": {"pending_operation": ""}}
+    )
+    await database.sync_manifests.delete_one({"store_name": store_name, "file_id": file_id, "document_name": None})
+
+async def delete_manifest_entries(store_name: str, file_ids):
+    database = db.get_db()
+    await database.sync_manifests.delete_many({"store_name": store_name, "file_id": {"$in": list(file_ids)}})
+
+async def clear_manifest(store_name: str):
+    database = db.get_db()
+    await database.sync_manifests.delete_many({"store_name": store_name})
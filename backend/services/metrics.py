@@ -0,0 +1,74 @@
+from prometheus_client import Counter, Gauge, Histogram, REGISTRY
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+# Prometheus metrics for each stage of a sync and a chat turn, served by /metrics.
+# Every observation is a clock read and a lock-protected add; cache statistics
+# are read from the caches only when scraped.
+
+# Stages that can take minutes on big files
+SLOW_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+DRIVE_REQUEST_SECONDS = Histogram(
+    "drive_request_seconds", "Time spent in Drive API calls", ["operation"], buckets=SLOW_BUCKETS
+)
+DRIVE_LIST_SECONDS = DRIVE_REQUEST_SECONDS.labels("list")
+DRIVE_DOWNLOAD_SECONDS = DRIVE_REQUEST_SECONDS.labels("download")
+DRIVE_DOWNLOAD_BYTES = Counter("drive_download_bytes_total", "Bytes downloaded or exported from Drive")
+TEMP_FILE_WRITE_SECONDS = Histogram(
+    "temp_file_write_seconds", "Time spent writing one downloaded file to its temp file", buckets=SLOW_BUCKETS
+)
+
+GEMINI_UPLOAD_SECONDS = Histogram(
+    "gemini_upload_seconds", "Time to upload one file to a File Search store", buckets=SLOW_BUCKETS
+)
+GEMINI_UPLOAD_BYTES = Counter("gemini_upload_bytes_total", "Bytes uploaded to File Search stores")
+INDEXING_WAIT_SECONDS = Histogram(
+    "gemini_indexing_wait_seconds", "Time from upload until File Search finished indexing the file", buckets=SLOW_BUCKETS
+)
+
+MONGO_SESSION_SECONDS = Histogram(
+    "mongo_session_seconds", "Latency of session reads and writes that reach MongoDB", ["operation"]
+)
+MONGO_SESSION_READ_SECONDS = MONGO_SESSION_SECONDS.labels("read")
+MONGO_SESSION_WRITE_SECONDS = MONGO_SESSION_SECONDS.labels("write")
+
+CHAT_GENERATION_SECONDS = Histogram(
+    "chat_generation_seconds", "Time for the model to produce a complete reply", ["endpoint"], buckets=SLOW_BUCKETS
+)
+CHAT_FIRST_TOKEN_SECONDS = Histogram(
+    "chat_first_token_seconds", "Time until the first streamed chunk of a reply", buckets=SLOW_BUCKETS
+)
+CHAT_ANSWERS = Counter("chat_answers_total", "Chat replies by source", ["source"])
+
+THROTTLE_WAIT_SECONDS = Histogram(
+    "throttle_wait_seconds", "Time requests waited for a rate limit token or a retry backoff", ["service"],
+    buckets=SLOW_BUCKETS
+)
+RATE_LIMIT_RETRIES = Counter("rate_limit_retries_total", "Requests retried after a throttled or failed response", ["service"])
+
+SYNC_FILES = Counter("sync_files_total", "Files handled by syncs", ["result"])
+SYNCS_IN_PROGRESS = Gauge("syncs_in_progress", "Sync jobs running in this process")
+CHATS_IN_PROGRESS = Gauge("chats_in_progress", "Chat requests being answered")
+
+STARTUP_SECONDS = Gauge("startup_seconds", "Duration of each startup phase of this process", ["phase"])
+
+_caches = {}
+
+def register_cache(name, cache):
+    """
+    Exports hit/miss counters and the size of a services.cache.TTLCache.
+    """
+    _caches[name] = cache
+
+class _CacheCollector:
+    def collect(self):
+        hits = CounterMetricFamily("cache_hits", "Cache lookups that found an entry", labels=["cache"])
+        misses = CounterMetricFamily("cache_misses", "Cache lookups that found nothing", labels=["cache"])
+        entries = GaugeMetricFamily("cache_entries", "Entries currently cached", labels=["cache"])
+        for name, cache in _caches.items():
+            hits.add_metric([name], cache.hits)
+            misses.add_metric([name], cache.misses)
+            entries.add_metric([name], len(cache))
+        return [hits, misses, entries]
+
+REGISTRY.register(_CacheCollector())
@@ -0,0 +1,115 @@
+import asyncio
+import random
+from config import OPERATION_POLL_MIN_INTERVAL, OPERATION_POLL_MAX_INTERVAL, OPERATION_POLL_BACKOFF
+from services.executor import run_bulk
+from services.metrics import INDEXING_WAIT_SECONDS
+from services.rag_service import get_operation
+
+# Transient errors tolerated while polling one operation before giving up on it
+MAX_POLL_FAILURES = 5
+
+class OperationTracker:
+    """
+    Waits on many long-running File Search operations from a single poll loop.
+    Each operation is re-polled with its own exponential backoff (plus jitter),
+    so fresh uploads are checked often and long indexing jobs only occasionally.
+    """
+
+    def __init__(self, min_interval=OPERATION_POLL_MIN_INTERVAL, max_interval=OPERATION_POLL_MAX_INTERVAL,
+                 backoff=OPERATION_POLL_BACKOFF):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self._pending = []
+        self._task = None
+        self._wakeup = None
+
+    def __len__(self):
+        return len(self._pending)
+
+    async def wait(self, client, operation):
+        """
+        Resolves with the completed operation. Raises if the operation failed.
+        """
+        with INDEXING_WAIT_SECONDS.time():
+            return await self._wait(client, operation)
+
+    async def _wait(self, client, operation):
+        if operation.done:
+            return self._result(operation)
+
+        loop = asyncio.get_running_loop()
+        entry = {
+            "client": client,
+            "operation": operation,
+            "future": loop.create_future(),
+            "interval": self.min_interval,
+            "next_poll": loop.time() + self.min_interval,
+            "failures": 0
+        }
+        self._pending.append(entry)
+
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+        else:
+            self._wakeup.set()
+
+        return await entry["future"]
+
+    @staticmethod
+    def _result(operation):
+        if operation.error:
+            raise RuntimeError(f"Indexing failed: {operation.error}")
+        return operation
+
+    def _schedule(self, entry, now):
+        entry["interval"] = min(entry["interval"] * self.backoff, self.max_interval)
+        entry["next_poll"] = now + entry["interval"] * random.uniform(0.8, 1.2)
+
+    async def _poll(self, entry):
+        return await run_bulk(get_operation, entry["client"], entry["operation"])
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while self._pending:
+            # Waiters that were cancelled (e.g. the sync was abandoned) need no more polling.
+            self._pending = [entry for entry in self._pending if not entry["future"].done()]
+
+            now = loop.time()
+            due = [entry for entry in self._pending if entry["next_poll"] <= now]
+            if due:
+                results = await asyncio.gather(*(self._poll(entry) for entry in due), return_exceptions=True)
+                now = loop.time()
+                for entry, result in zip(due, results):
+                    if entry["future"].done():
+                        continue
+                    if isinstance(result, Exception):
+                        entry["failures"] += 1
+                        if entry["failures"] >= MAX_POLL_FAILURES:
+                            entry["future"].set_exception(result)
+                        else:
+                            self._schedule(entry, now)
+                    elif result.done:
+                        try:
+                            entry["future"].set_result(self._result(result))
+                        except Exception as e:
+                            entry["future"].set_exception(e)
+                    else:
+                        entry["operation"] = result
+                        entry["failures"] = 0
+                        self._schedule(entry, now)
+                self._pending = [entry for entry in self._pending if not entry["future"].done()]
+
+            if not self._pending:
+                break
+
+            delay = max(0, min(entry["next_poll"] for entry in self._pending) - loop.time())
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+# Shared by every sync in this process
+tracker = OperationTracker()
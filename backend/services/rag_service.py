@@ -1,34 +1,94 @@
-from google import genai
-from google.genai import types
 import os
 from dotenv import load_dotenv
-import tempfile
+from services.metrics import GEMINI_UPLOAD_SECONDS, GEMINI_UPLOAD_BYTES
+from services.rate_limiter import UNLIMITED, gemini_limiter
+import io
+import itertools
 import time
-import mimetypes
+import weakref
 
 load_dotenv()
 
+# google.genai takes a large share of startup to import, so it is loaded on
+# first use (services.warmup does that in the background after startup)
+genai = None
+
+def _genai():
+    global genai
+    if genai is None:
+        from google import genai as sdk
+        genai = sdk
+    return genai
+
+# Rate limiter of the API key behind each client and chat created here
+_limiters = weakref.WeakKeyDictionary()
+
+def _limiter(owner):
+    return _limiters.get(owner, UNLIMITED)
+
 def get_client(api_key):
-    return genai.Client(api_key=api_key)
+    """
+    Gemini client whose calls in this module share the API key's rate limiter.
+    """
+    client = _genai().Client(api_key=api_key)
+    _limiters[client] = gemini_limiter(api_key)
+    return client
+
+def close_client(client):
+    """
+    Releases the client's connections; errors are ignored.
+    """
+    try:
+        client.close()
+    except Exception:
+        pass
+
+# Every store this app creates is named with this prefix
+STORE_DISPLAY_PREFIX = 'Drive_RAG_Store_'
+
+def create_store(client):
+    """
+    Creates a new File Search store and returns its name.
+    """
+    file_search_store = _limiter(client).call(
+        client.file_search_stores.create,
+        config={'display_name': f'{STORE_DISPLAY_PREFIX}{int(time.time())}'}
+    )
+    print(f"Created new store: {file_search_store.name}")
+    return file_search_store.name
+
+def delete_store(client, store_name):
+    """
+    Deletes a File Search store together with all of its documents.
+    """
+    _limiter(client).call(client.file_search_stores.delete, name=store_name, config={'force': True})
+    print(f"Deleted store: {store_name}")
+
+def store_reachable(client, store_name):
+    """
+    Whether the client's API key can still use the store. False if it was
+    deleted or belongs to another key's project (NOT_FOUND / PERMISSION_DENIED).
+    """
+    try:
+        _limiter(client).call(client.file_search_stores.get, name=store_name)
+    except Exception as e:
+        if getattr(e, "code", None) in (403, 404):
+            return False
+        raise
+    return True
 
 def upload_file_to_store(client, file_content, display_name, mime_type='application/pdf', store_name=None):
     """
     Uploads a file to a Gemini File Search Store.
-    Yields progress messages. Returns store_name.
+    `file_content` is the bytes to upload, the path of a file on disk, or a
+    readable binary file object positioned at the start of the content (e.g.
+    the spooled download from drive_service). Nothing is copied to disk: bytes
+    are uploaded from memory and paths and file objects are streamed in place.
+    File objects are left open for the caller to close.
+    Yields progress messages. Returns (store_name, operation) as soon as the
+    file is uploaded; indexing is still running and the caller waits for the
+    operation (see services.operation_tracker) before using the document.
     """
-    
-    # Determine suffix based on mime_type or display_name
-    suffix = mimetypes.guess_extension(mime_type)
-    
-    # Fallback to display_name extension if mime_type guess fails or is generic
-    if not suffix or suffix == '.bin':
-        _, ext = os.path.splitext(display_name)
-        if ext:
-            suffix = ext
-    
-    # Default if still unknown
-    if not suffix:
-        suffix = ".bin"
 
     # Proactive fix for CSV files: Handle various CSV mime types
     # If it looks like a CSV (extension or mime), treat as text/plain to ensure Gemini accepts it
@@ -53,78 +113,102 @@ def upload_file_to_store(client, file_content, display_name, mime_type='applicat
     if is_csv or is_code_or_text:
         print(f"Detected text/code file: {display_name} ({mime_type}). Forcing text/plain for upload.")
         mime_type = 'text/plain'
-        if not suffix:
-            # Try to preserve original extension if possible, or default to .txt for safety
-            _, ext = os.path.splitext(display_name)
-            suffix = ext if ext else ".txt"
-
-    # Create a temporary file to write content
-    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-        tmp.write(file_content)
-        tmp_path = tmp.name
-    
-    print(f"Temp file created at: {tmp_path} with suffix: {suffix}, size: {len(file_content)} bytes")
+
+    owns_handle = not hasattr(file_content, 'read')
+    if isinstance(file_content, (bytes, bytearray)):
+        handle = io.BytesIO(file_content)
+    elif owns_handle:
+        handle = open(file_content, 'rb')
+    else:
+        handle = file_content
 
     try:
+        # Where the content starts: retries rewind here instead of reading the source again
+        start = handle.tell()
+        size = handle.seek(0, os.SEEK_END) - start
+        handle.seek(start)
+        print(f"Uploading {display_name}, size: {size} bytes")
+
         # 1. Create or Get Store
         if not store_name:
-            file_search_store = client.file_search_stores.create(
-                config={'display_name': f'Drive_RAG_Store_{int(time.time())}'}
-            )
-            store_name = file_search_store.name
-            print(f"Created new store: {store_name}")
+            store_name = create_store(client)
         
         # 2. Upload and Import File
         yield "Sending file to File Search"
             
         print(f"Uploading {display_name} ({mime_type}) to {store_name}...")
         
-        try:
-            operation = client.file_search_stores.upload_to_file_search_store(
-                file=tmp_path,
-                file_search_store_name=store_name,
-                config={
-                    'display_name': display_name,
-                    'mime_type': mime_type
-                }
-            )
-        except Exception as e:
-            # Fallback retry
-            print(f"Upload failed with {mime_type}, retrying as text/plain... Error: {e}")
-            yield "Retrying upload as text/plain..."
-            operation = client.file_search_stores.upload_to_file_search_store(
-                file=tmp_path,
+        def send(upload_mime_type):
+            # Each attempt (rate-limit retries included) re-sends the same handle from the start
+            handle.seek(start)
+            return client.file_search_stores.upload_to_file_search_store(
+                file=handle,
                 file_search_store_name=store_name,
                 config={
                     'display_name': display_name,
-                    'mime_type': 'text/plain'
+                    'mime_type': upload_mime_type
                 }
             )
+
+        limiter = _limiter(client)
+        with GEMINI_UPLOAD_SECONDS.time():
+            try:
+                operation = limiter.call(send, mime_type)
+            except Exception as e:
+                if mime_type == 'text/plain':
+                    raise
+                # Fallback retry
+                print(f"Upload failed with {mime_type}, retrying as text/plain... Error: {e}")
+                yield "Retrying upload as text/plain..."
+                operation = limiter.call(send, 'text/plain')
+        GEMINI_UPLOAD_BYTES.inc(size)
         
-        # Wait for operation to complete
+        # Indexing continues server-side; the caller waits on the operation
         yield "Indexing and chunking"
             
-        while not operation.done:
-            time.sleep(1)
-            operation = client.operations.get(operation)
-            
-        print(f"Upload complete for {display_name}")
-        return store_name
+        print(f"Upload submitted for {display_name}")
+        return store_name, operation
         
     finally:
-        # Clean up temp file
-        if os.path.exists(tmp_path):
-            try:
-                os.remove(tmp_path)
-            except:
-                pass
+        if owns_handle:
+            handle.close()
+
+def get_operation(client, operation):
+    """
+    Refreshed state of a long-running upload operation.
+    """
+    return _limiter(client).call(client.operations.get, operation)
+
+def operation_by_name(name):
+    """
+    Handle for polling an upload operation known only by name, e.g. one
+    started before the process restarted.
+    """
+    from google.genai import types
 
-def create_chat_session(client, store_name, history=None):
+    return types.UploadToFileSearchStoreOperation(name=name)
+
+def get_document_name(operation):
+    """
+    Name of the document created by a completed upload operation.
     """
-    Creates a chat session with the File Search tool enabled for the given store.
+    return operation.response.document_name if operation.response else None
+
+def delete_document(client, document_name):
     """
+    Removes a single document (and its chunks) from its File Search store.
+    """
+    _limiter(client).call(client.file_search_stores.documents.delete, name=document_name, config={'force': True})
+    print(f"Deleted document: {document_name}")
+
+def create_chat_session(client, store_names, history=None):
+    """
+    Creates a chat session with the File Search tool searching all of the given stores.
+    """
+    from google.genai import types
+
     # Create chat
-    print(f"Creating chat session with model: gemini-2.5-flash and store: {store_name}")
+    print(f"Creating chat session with model: gemini-2.5-flash and stores: {', '.join(store_names)}")
     try:
         chat = client.chats.create(
             model="gemini-2.5-flash", 
@@ -137,24 +221,79 @@ def create_chat_session(client, store_name, history=None):
                 4. If the answer is not in the documents, state that clearly.""",
                 tools=[types.Tool(
                     file_search=types.FileSearch(
-                        file_search_store_names=[store_name]
+                        file_search_store_names=list(store_names)
                     )
                 )]
             ),
             history=history
         )
+        _limiters[chat] = _limiter(client)
         print("Chat session created successfully.")
         return chat
     except Exception as e:
         print(f"Error creating chat session: {e}")
         raise e
 
-def generate_response(chat_session, message):
-    try:
-        response = chat_session.send_message(message)
-        if not response.candidates:
-            return "I could not generate a response. The model might have blocked it due to safety settings."
-        return response.text
-    except Exception as e:
-        print(f"Error generating response: {e}")
-        return f"An error occurred while generating the response: {str(e)}"
+def stream_response(chat_session, message):
+    """
+    Streams a reply. Yields ("delta", text) for each chunk of text, then a
+    single ("grounding", metadata dict or None) taken from the last chunk
+    that carried grounding metadata.
+    """
+    grounding = None
+    for chunk in _limiter(chat_session).call(_start_stream, chat_session, message):
+        if chunk.candidates and chunk.candidates[0].grounding_metadata:
+            grounding = chunk.candidates[0].grounding_metadata.model_dump(mode="json", exclude_none=True)
+        if chunk.text:
+            yield "delta", chunk.text
+    yield "grounding", grounding
+
+def _start_stream(chat_session, message):
+    """
+    Opens a reply stream and waits for its first chunk, so that throttling
+    (which surfaces there) can be retried before anything was yielded.
+    Returns an iterator over all chunks.
+    """
+    stream = chat_session.send_message_stream(message)
+    first = next(stream, None)
+    return itertools.chain([first] if first is not None else [], stream)
+
+def summarize_conversation(client, previous_summary, history):
+    """
+    Folds older chat turns into a short running summary used as chat context.
+    """
+    transcript = "\n".join(f"{turn['role']}: {turn['parts'][0]['text']}" for turn in history)
+    prompt = (
+        "Update the running summary of a conversation between a user and an assistant "
+        "answering questions about the user's documents. Keep names, facts and open questions; "
+        "stay under 200 words.\n\n"
+        f"Current summary:\n{previous_summary or '(none)'}\n\n"
+        f"New turns:\n{transcript}"
+    )
+    response = _limiter(client).call(client.models.generate_content, model="gemini-2.5-flash", contents=prompt)
+    return response.text
+
+BLOCKED_RESPONSE = "I could not generate a response. The model might have blocked it due to safety settings."
+
+def generate_answer(chat_session, message):
+    """
+    Sends a message and returns (text, grounding metadata dict or None).
+    Text is None if the model returned no candidates. Errors are raised.
+    """
+    response = _limiter(chat_session).call(chat_session.send_message, message)
+    if not response.candidates:
+        return None, None
+    grounding = response.candidates[0].grounding_metadata
+    return response.text, grounding.model_dump(mode="json", exclude_none=True) if grounding else None
+
+def record_turn(chat_session, message, response_text):
+    """
+    Adds a turn answered elsewhere (e.g. from the answer cache) to a live chat's history.
+    """
+    from google.genai import types
+
+    chat_session.record_history(
+        user_input=types.Content(role="user", parts=[types.Part(text=message)]),
+        model_output=[types.Content(role="model", parts=[types.Part(text=response_text)])],
+        is_valid=True
+    )
@@ -0,0 +1,183 @@
+import random
+import threading
+import time
+from config import (
+    DRIVE_RATE_LIMIT_PER_SECOND, DRIVE_RATE_LIMIT_BURST, GEMINI_RATE_LIMIT_PER_SECOND, GEMINI_RATE_LIMIT_BURST,
+    RATE_LIMIT_MAX_RETRIES, RATE_LIMIT_BACKOFF_BASE, RATE_LIMIT_BACKOFF_MAX, RATE_LIMIT_INTERACTIVE_RESERVE
+)
+from services.cache import TTLCache
+from services.executor import in_bulk_thread
+from services.metrics import THROTTLE_WAIT_SECONDS, RATE_LIMIT_RETRIES
+
+# Client-side quota handling for Google APIs. Every Drive user and every Gemini
+# API key gets one token bucket shared by all requests made with it in this
+# process. Requests that still come back throttled (429, Drive's 403 rate limit
+# reasons, 5xx) are retried with exponential backoff and jitter, waiting at
+# least as long as the server's Retry-After asks, and the whole bucket pauses
+# for that time so concurrent requests don't pile onto the same quota.
+# Background work (calls from services.executor.run_bulk threads) leaves part
+# of each bucket to interactive calls, so chat is not stuck behind a sync.
+
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+DRIVE_RATE_LIMIT_REASONS = (b"userRateLimitExceeded", b"rateLimitExceeded")
+
+class RateLimiter:
+    """
+    Token bucket refilled at `rate` requests per second, holding up to `burst`.
+    Callers block in acquire() (they run in executor threads, not the event loop).
+    Bulk callers only take a token while RATE_LIMIT_INTERACTIVE_RESERVE of the
+    burst would remain for interactive ones.
+    """
+
+    def __init__(self, name, rate, burst):
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        needed = min(self.burst, 1 + self.burst * RATE_LIMIT_INTERACTIVE_RESERVE) if in_bulk_thread() else 1
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                wait = self._paused_until - now
+                if wait <= 0:
+                    if self._tokens >= needed:
+                        self._tokens -= 1
+                        break
+                    wait = (needed - self._tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+        if waited:
+            THROTTLE_WAIT_SECONDS.labels(self.name).observe(waited)
+
+    def pause(self, seconds):
+        """
+        Holds back every request through this bucket for `seconds` (a server's Retry-After).
+        """
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def backoff(self, attempt, retry_after=None):
+        """
+        Sleeps before retry number `attempt` (0-based).
+        """
+        delay = min(RATE_LIMIT_BACKOFF_MAX, RATE_LIMIT_BACKOFF_BASE * 2 ** attempt) * random.uniform(0.5, 1.0)
+        if retry_after:
+            self.pause(retry_after)
+            delay = max(delay, retry_after)
+        RATE_LIMIT_RETRIES.labels(self.name).inc()
+        with THROTTLE_WAIT_SECONDS.labels(self.name).time():
+            time.sleep(delay)
+
+    def call(self, fn, *args, **kwargs):
+        """
+        Calls fn once a token is available, retrying throttled and transient errors.
+        """
+        attempt = 0
+        while True:
+            self.acquire()
+            try:
+                return fn(*args, **kwargs)
+            except Exception as e:
+                retryable, retry_after = _classify_error(e)
+                if not retryable or attempt >= RATE_LIMIT_MAX_RETRIES:
+                    raise
+                print(f"{self.name} request throttled or failed ({e}); retry {attempt + 1}/{RATE_LIMIT_MAX_RETRIES}")
+            self.backoff(attempt, retry_after)
+            attempt += 1
+
+class _Unlimited:
+    def acquire(self):
+        pass
+
+    def call(self, fn, *args, **kwargs):
+        return fn(*args, **kwargs)
+
+UNLIMITED = _Unlimited()
+
+_limiters = TTLCache(maxsize=10000, ttl=60 * 60)
+_limiters_lock = threading.Lock()
+
+def _limiter(name, key, rate, burst):
+    with _limiters_lock:
+        limiter = _limiters.get((name, key))
+        if limiter is None:
+            limiter = RateLimiter(name, rate, burst)
+        # Refresh the expiry on every use so busy buckets are never replaced
+        _limiters.set((name, key), limiter)
+    return limiter
+
+def drive_limiter(user_key):
+    return _limiter("drive", user_key, DRIVE_RATE_LIMIT_PER_SECOND, DRIVE_RATE_LIMIT_BURST)
+
+def gemini_limiter(api_key):
+    return _limiter("gemini", api_key, GEMINI_RATE_LIMIT_PER_SECOND, GEMINI_RATE_LIMIT_BURST)
+
+def _parse_retry_after(value):
+    if not value:
+        return None
+    value = str(value).strip()
+    try:
+        return max(0.0, float(value.rstrip("s")))
+    except ValueError:
+        return None
+
+def _classify_error(error):
+    """
+    Returns (retryable, retry-after seconds or None) for an exception from the Gemini SDK.
+    """
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True, None
+    import httpx # The SDK's transport; only loaded once an error needs classifying
+
+    if isinstance(error, httpx.TransportError): # Connection reset, read timeout, ...
+        return True, None
+    code = getattr(error, "code", None)
+    if code not in RETRYABLE_STATUSES:
+        return False, None
+
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    retry_after = _parse_retry_after(headers.get("retry-after"))
+    if retry_after is None:
+        # Gemini reports quota back-off as a RetryInfo detail, e.g. {"retryDelay": "17s"}
+        details = getattr(error, "details", None) or {}
+        for detail in (details.get("error") or {}).get("details") or []:
+            if isinstance(detail, dict) and detail.get("retryDelay"):
+                retry_after = _parse_retry_after(detail["retryDelay"])
+    return True, retry_after
+
+class ThrottledHttp:
+    """
+    Wraps the httplib2-style transport of a googleapiclient service so every
+    request (including media chunks) goes through `limiter`, and throttled
+    responses are retried before googleapiclient sees them.
+    """
+
+    def __init__(self, http, limiter):
+        self._http = http
+        self._limiter = limiter
+
+    def __getattr__(self, name):
+        return getattr(self._http, name)
+
+    def request(self, uri, method="GET", *args, **kwargs):
+        attempt = 0
+        while True:
+            self._limiter.acquire()
+            response, content = self._http.request(uri, method, *args, **kwargs)
+            throttled = response.status in RETRYABLE_STATUSES or (
+                response.status == 403 and any(reason in (content or b"") for reason in DRIVE_RATE_LIMIT_REASONS)
+            )
+            if not throttled or attempt >= RATE_LIMIT_MAX_RETRIES:
+                return response, content
+            print(f"Drive request throttled with HTTP {response.status}; retry {attempt + 1}/{RATE_LIMIT_MAX_RETRIES}")
+            self._limiter.backoff(attempt, _parse_retry_after(response.get("retry-after")))
+            attempt += 1
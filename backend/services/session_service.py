@@ -1,37 +1,56 @@
 from database import db
-from fastapi import Header, HTTPException
+from config import SESSION_CACHE_SIZE, SESSION_CACHE_TTL_SECONDS
+from services.cache import TTLCache
+from services.metrics import MONGO_SESSION_READ_SECONDS, MONGO_SESSION_WRITE_SECONDS, register_cache
+
+# session_id -> {projection fields (or None for the whole document): document}.
+# Writes through this module invalidate the session's entry; the short TTL
+# bounds staleness from writes made by other processes.
+_session_cache = TTLCache(maxsize=SESSION_CACHE_SIZE, ttl=SESSION_CACHE_TTL_SECONDS)
+register_cache("sessions", _session_cache)
+# Bumped on every write so a read that raced with a write is not cached.
+_write_epoch = 0
+
+def invalidate_session_cache(session_id: str):
+    global _write_epoch
+    _write_epoch += 1
+    _session_cache.discard(session_id)
+
+async def get_session_data(session_id: str, projection: dict = None):
+    """
+    Returns the session document, or only the fields in `projection`.
+    Callers get their own copy and may modify it freely.
+    """
+    fields = tuple(sorted(projection)) if projection else None
+    cached = _session_cache.get(session_id)
+    if cached is not None and fields in cached:
+        return dict(cached[fields])
 
-async def get_session_data(session_id: str):
     database = db.get_db()
-    return await database.sessions.find_one({"session_id": session_id})
+    epoch = _write_epoch
+    with MONGO_SESSION_READ_SECONDS.time():
+        session = await database.sessions.find_one({"session_id": session_id}, projection)
+    if session is None:
+        return None
+
+    if epoch == _write_epoch:
+        entry = _session_cache.get(session_id) or {}
+        entry[fields] = session
+        _session_cache.set(session_id, entry)
+    return dict(session)
 
 async def save_session_data(session_id: str, data: dict):
     database = db.get_db()
-    await database.sessions.update_one(
-        {"session_id": session_id},
-        {"$set": data},
-        upsert=True
-    )
+    with MONGO_SESSION_WRITE_SECONDS.time():
+        await database.sessions.update_one(
+            {"session_id": session_id},
+            {"$set": data},
+            upsert=True
+        )
+    invalidate_session_cache(session_id)
 
 async def delete_session_data(session_id: str):
     database = db.get_db()
-    await database.sessions.delete_one({"session_id": session_id})
-
-async def get_current_session(x_session_id: str = Header(None)):
-    if not x_session_id:
-        raise HTTPException(status_code=400, detail="Session ID header is required")
-    
-    session = await get_session_data(x_session_id)
-    if not session:
-        # Create a new session if it doesn't exist? 
-        # Or just return empty dict?
-        # For now, let's return an empty dict so we can populate it.
-        return {}
-    return session
-
-async def get_optional_session(x_session_id: str = Header(None)):
-    if not x_session_id:
-        return {}
-    
-    session = await get_session_data(x_session_id)
-    return session or {}
+    with MONGO_SESSION_WRITE_SECONDS.time():
+        await database.sessions.delete_one({"session_id": session_id})
+    invalidate_session_cache(session_id)
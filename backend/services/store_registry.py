@@ -0,0 +1,214 @@
+from database import db
+from config import STORE_IDLE_TTL_SECONDS, STORE_SWEEP_INTERVAL_SECONDS, SESSION_MAX_STORES
+from services.executor import run_bulk
+from services.manifest_service import clear_manifest
+from services.rag_service import get_client, close_client, delete_store
+from services.session_service import invalidate_session_cache
+from datetime import datetime, timedelta
+from pymongo import ReturnDocument
+import asyncio
+import hashlib
+
+# One File Search store per (owner, folder set), reused by every later sync of
+# the same selection. The documents in each store are listed in the manifest
+# (services.manifest_service); stores nobody uses any more are swept.
+# A session chats over a set of these stores (session["stores"]), so adding a
+# folder to the conversation only indexes that folder.
+
+def store_owner(session_id: str, session: dict):
+    """
+    Stores belong to the Google account when known, so they survive re-login.
+    """
+    return (session.get("user") or {}).get("email") or session_id
+
+def folder_key(items):
+    """
+    Stable key for a selection of Drive items.
+    """
+    return hashlib.sha256(",".join(sorted(item["id"] for item in items)).encode()).hexdigest()
+
+def api_key_hash(api_key: str):
+    """
+    Stores belong to the Gemini project of the key that created them, so
+    registry entries record which key that was (never the key itself).
+    """
+    return hashlib.sha256(api_key.encode()).hexdigest()
+
+async def find_store(owner: str, key: str, api_key: str):
+    """
+    The registered store for the selection that `api_key` can use. Entries
+    from before keys were recorded match any key; the caller checks they are
+    still reachable.
+    """
+    database = db.get_db()
+    entries = database.file_search_stores.find(
+        {"owner": owner, "folder_key": key, "api_key_hash": {"$in": [api_key_hash(api_key), None]}}
+    ).sort("api_key_hash", -1).limit(1)
+    for entry in await entries.to_list(length=1):
+        return entry
+    return None
+
+async def register_store(store_name: str, owner: str, key: str, session_id: str, api_key: str):
+    database = db.get_db()
+    now = datetime.utcnow()
+    await database.file_search_stores.update_one(
+        {"store_name": store_name},
+        {"$set": {"owner": owner, "folder_key": key, "session_id": session_id, "api_key_hash": api_key_hash(api_key),
+                  "last_used_at": now},
+         "$setOnInsert": {"created_at": now}},
+        upsert=True
+    )
+
+async def touch_store(store_name: str, session_id: str, api_key: str, changes_token=None):
+    database = db.get_db()
+    update = {"session_id": session_id, "api_key_hash": api_key_hash(api_key), "last_used_at": datetime.utcnow()}
+    if changes_token:
+        update["changes_token"] = changes_token
+    await database.file_search_stores.update_one({"store_name": store_name}, {"$set": update})
+
+def selection_name(items):
+    """
+    Label for a selection of Drive items, e.g. "Reports, Notes +3 more".
+    """
+    names = [item["name"] for item in items[:2]]
+    if len(items) > 2:
+        names[-1] += f" +{len(items) - 2} more"
+    return ", ".join(names)
+
+def session_store_names(session: dict):
+    """
+    Names of the stores the session chats over, oldest first. Sessions from
+    before store sets only have `store_name`.
+    """
+    if "stores" in session:
+        return [entry["store_name"] for entry in session["stores"]]
+    return [session["store_name"]] if session.get("store_name") else []
+
+async def attach_store(session_id: str, session: dict, store_name: str, key: str, name: str, replace: bool = False):
+    """
+    Adds the store to the session's set, replacing the one for the same
+    selection, or with `replace` makes it the only one. Keeps at most
+    SESSION_MAX_STORES, dropping the oldest. `session` must hold the current
+    `store_name` and `stores`. Returns True if the set of store names changed,
+    or None if the session no longer exists (e.g. the user logged out).
+    """
+    database = db.get_db()
+    previous = session_store_names(session)
+    entry = {"store_name": store_name, "folder_key": key, "name": name, "added_at": datetime.utcnow()}
+
+    if replace:
+        update = {"$set": {"stores": [entry], "store_name": store_name}}
+    else:
+        if "stores" not in session and session.get("store_name") not in (None, store_name):
+            # Carry a pre-set session's store over as the first entry
+            registered = await database.file_search_stores.find_one({"store_name": session["store_name"]}, {"folder_key": 1})
+            await database.sessions.update_one(
+                {"session_id": session_id, "stores": {"$exists": False}},
+                {"$set": {"stores": [{"store_name": session["store_name"], "folder_key": (registered or {}).get("folder_key"),
+                                      "name": None, "added_at": entry["added_at"]}]}}
+            )
+        await database.sessions.update_one(
+            {"session_id": session_id},
+            {"$pull": {"stores": {"folder_key": key}}}
+        )
+        update = {"$push": {"stores": {"$each": [entry], "$slice": -SESSION_MAX_STORES}},
+                  "$set": {"store_name": store_name}}
+    updated = await database.sessions.update_one({"session_id": session_id}, update)
+    invalidate_session_cache(session_id)
+    if not updated.matched_count:
+        return None
+
+    current = await database.sessions.find_one({"session_id": session_id}, {"stores": 1}) or {}
+    session["stores"] = current.get("stores", [])
+    session["store_name"] = store_name
+    return set(previous) != set(session_store_names(session))
+
+async def detach_store(session_id: str, key: str):
+    """
+    Removes the store for the selection `key` from the session's set. The
+    store itself is kept until the sweeper finds it idle, so adding the
+    selection back is cheap. Returns the remaining entries, or None if the
+    session had no such store.
+    """
+    database = db.get_db()
+    session = await database.sessions.find_one_and_update(
+        {"session_id": session_id, "stores.folder_key": key},
+        {"$pull": {"stores": {"folder_key": key}}},
+        projection={"stores": 1},
+        return_document=ReturnDocument.AFTER
+    )
+    if session is None:
+        return None
+    stores = session.get("stores", [])
+    # `store_name` stays the most recently added store, or goes with the last one
+    if stores:
+        await database.sessions.update_one({"session_id": session_id}, {"$set": {"store_name": stores[-1]["store_name"]}})
+    else:
+        await database.sessions.update_one({"session_id": session_id}, {"$unset": {"store_name": ""}})
+    invalidate_session_cache(session_id)
+    return stores
+
+async def _api_key_for(entry):
+    """
+    A Gemini API key able to manage the store: the key that created it, from
+    the last syncing session or any other session of the same owner.
+    """
+    database = db.get_db()
+    async for session in database.sessions.find(
+        {"$or": [{"session_id": entry.get("session_id")}, {"user.email": entry["owner"]}],
+         "gemini_api_key": {"$exists": True}},
+        {"gemini_api_key": 1}
+    ):
+        if entry.get("api_key_hash") in (None, api_key_hash(session["gemini_api_key"])):
+            return session["gemini_api_key"]
+    return None
+
+async def sweep_stores():
+    """
+    Deletes registered stores idle for STORE_IDLE_TTL_SECONDS that are in no
+    session's store set. Stores this database has no record of are never
+    touched: another deployment may be using them under the same API key.
+    """
+    database = db.get_db()
+    cutoff = datetime.utcnow() - timedelta(seconds=STORE_IDLE_TTL_SECONDS)
+    deleted = 0
+
+    async for entry in database.file_search_stores.find({"last_used_at": {"$lt": cutoff}}):
+        store_name = entry["store_name"]
+        if await database.sessions.find_one({"$or": [{"store_name": store_name}, {"stores.store_name": store_name}]},
+                                            {"_id": 1}):
+            continue
+
+        api_key = await _api_key_for(entry)
+        if not api_key:
+            print(f"No API key available to delete stale store {store_name}; skipping.")
+            continue
+
+        client = await run_bulk(get_client, api_key)
+        try:
+            await run_bulk(delete_store, client, store_name)
+        except Exception as e:
+            if getattr(e, "code", None) != 404: # Already gone: just drop the entry
+                print(f"Failed to delete stale store {store_name}: {e}")
+                continue
+        finally:
+            close_client(client)
+
+        await clear_manifest(store_name)
+        await database.file_search_stores.delete_one({"store_name": store_name})
+        deleted += 1
+
+    if deleted:
+        print(f"Store sweep deleted {deleted} stores.")
+    return deleted
+
+async def run_sweeper(interval=STORE_SWEEP_INTERVAL_SECONDS):
+    """
+    Background task started with the app: sweeps stale stores every `interval` seconds.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await sweep_stores()
+        except Exception as e:
+            print(f"Store sweep failed: {e}")
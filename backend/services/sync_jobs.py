@@ -0,0 +1,449 @@
+from database import db
+from config import SYNC_JOB_WORKERS, SYNC_JOB_LEASE_SECONDS, SYNC_JOB_EVENT_LOG_SIZE
+from services.executor import run_bulk
+from services.rag_service import get_client, close_client
+from services.sync_service import sync_items, progress_event, format_duration
+from services.session_service import get_session_data
+from services.history_service import clear_history
+from services.chat_cache import invalidate_session
+from services.answer_cache import invalidate_store
+from services.store_registry import (
+    store_owner, folder_key, selection_name, find_store, register_store, touch_store, attach_store
+)
+from services.metrics import SYNCS_IN_PROGRESS
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta
+import asyncio
+import heapq
+import time
+import uuid
+
+# Syncs run as jobs owned by background workers rather than by the request
+# that started them, so a closed tab or a proxy timeout does not abort them.
+# Each job lives in the sync_jobs collection with its recent events and the ids
+# of files already indexed; a job whose worker stops checking in is resumed
+# from there by another worker.
+# At most SYNC_JOB_WORKERS jobs run at once per process. The rest wait in a
+# queue served round-robin by session and are told their position and
+# estimated start time as the queue moves.
+
+# The sync reads these session fields
+JOB_SESSION_FIELDS = {field: 1 for field in ("credentials", "gemini_api_key", "store_name", "stores", "user")}
+
+ACTIVE_STATUSES = ("queued", "running")
+TERMINAL_STATUSES = ("complete", "error")
+
+# Per-file "progress" and queue position events are only streamed live; the rest are persisted.
+_LIVE_ONLY = ("progress", "queued")
+
+# Assumed length of a sync until one has finished in this process
+DEFAULT_JOB_SECONDS = 60
+
+class _FairQueue:
+    """
+    Job ids waiting for a worker. Each session's jobs are served in the order
+    they were queued, but sessions take turns: one with many queued syncs does
+    not hold everyone else up until all of them have run.
+    """
+
+    def __init__(self):
+        self._sessions = OrderedDict()
+        self._available = asyncio.Semaphore(0)
+
+    def put(self, session_id, job_id):
+        self._sessions.setdefault(session_id, deque()).append(job_id)
+        self._available.release()
+
+    async def get(self):
+        await self._available.acquire()
+        session_id, jobs = next(iter(self._sessions.items()))
+        job_id = jobs.popleft()
+        if jobs:
+            self._sessions.move_to_end(session_id)
+        else:
+            del self._sessions[session_id]
+        return job_id
+
+    def order(self):
+        """
+        Queued job ids in the order they will start, if nothing else is queued.
+        """
+        queues = [list(jobs) for jobs in self._sessions.values()]
+        return [queue[turn] for turn in range(max(map(len, queues), default=0))
+                for queue in queues if turn < len(queue)]
+
+_queue = _FairQueue()
+_queued_ids = set()
+_live = {}
+_tasks = []
+# job_id -> {"started": monotonic time, "eta": planned seconds or None, "planned_at": ...} for running jobs
+_running = {}
+# Recent sync durations in this process, for queue start estimates
+_durations = {"average": DEFAULT_JOB_SECONDS}
+_workers = {"count": 0}
+
+class _LiveJob:
+    """
+    In-memory event log of a job running in this process, for attached streams.
+    """
+
+    def __init__(self, next_seq=0):
+        self.events = []
+        self.next_seq = next_seq
+        self.finished = False
+        self.changed = asyncio.Event()
+        # Last (position, eta) sent while queued
+        self.queue_state = None
+
+    def publish(self, event):
+        event = {**event, "seq": self.next_seq}
+        self.next_seq += 1
+        self.events.append(event)
+        del self.events[:-SYNC_JOB_EVENT_LOG_SIZE]
+        self._notify()
+        return event
+
+    def finish(self):
+        self.finished = True
+        self._notify()
+
+    def detach(self):
+        """
+        Wakes attached streams after the job was taken off _live, so they follow it through Mongo.
+        """
+        self._notify()
+
+    def _notify(self):
+        # Wake everyone waiting on the current event, then start a new one.
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+def _public(job):
+    return {
+        "job_id": job["job_id"],
+        "status": job["status"],
+        "completed_files": len(job.get("completed_ids", [])),
+        "result": job.get("result"),
+        "created_at": job["created_at"].isoformat(),
+        "updated_at": job["updated_at"].isoformat()
+    }
+
+async def enqueue_sync(session_id: str, items, incremental: bool, add: bool = False, name: str = None):
+    """
+    Queues a sync of `items` for the session. When it finishes, the selection's
+    store becomes the session's only store, or with `add` joins its others.
+    Returns (job_id, created); if the same selection is already queued or
+    running for this session, that job is returned instead of starting another.
+    """
+    database = db.get_db()
+    key = folder_key(items)
+    active = await database.sync_jobs.find_one(
+        {"session_id": session_id, "folder_key": key, "status": {"$in": list(ACTIVE_STATUSES)}},
+        {"job_id": 1}
+    )
+    if active:
+        return active["job_id"], False
+
+    now = datetime.utcnow()
+    job_id = uuid.uuid4().hex
+    await database.sync_jobs.insert_one({
+        "job_id": job_id,
+        "session_id": session_id,
+        "items": items,
+        "incremental": incremental,
+        "add": add,
+        "name": name or selection_name(items),
+        "folder_key": key,
+        "status": "queued",
+        "events": [],
+        "next_seq": 0,
+        "completed_ids": [],
+        "created_at": now,
+        "updated_at": now
+    })
+    _submit(job_id, session_id)
+    return job_id, True
+
+async def get_job(job_id: str, session_id: str):
+    """
+    Returns the job's status, or None if it does not exist or belongs to another session.
+    """
+    database = db.get_db()
+    job = await database.sync_jobs.find_one(
+        {"job_id": job_id, "session_id": session_id},
+        {"events": 0, "items": 0}
+    )
+    return _public(job) if job else None
+
+async def follow_job(job_id: str, after: int = -1):
+    """
+    Yields the job's events with a sequence number greater than `after` until it finishes.
+    Jobs running in another process are followed through Mongo.
+    """
+    database = db.get_db()
+    while True:
+        live = _live.get(job_id)
+        if live:
+            changed = live.changed
+            for event in live.events:
+                if event["seq"] > after:
+                    after = event["seq"]
+                    yield event
+            if live.finished:
+                return
+            await changed.wait()
+            continue
+
+        job = await database.sync_jobs.find_one({"job_id": job_id}, {"events": 1, "status": 1})
+        if not job:
+            return
+        for event in job["events"]:
+            if event["seq"] > after:
+                after = event["seq"]
+                yield event
+        if job["status"] in TERMINAL_STATUSES:
+            return
+        await asyncio.sleep(1)
+
+def _submit(job_id, session_id, next_seq=0):
+    if job_id not in _queued_ids:
+        _queued_ids.add(job_id)
+        # Created now so that attached streams receive queue position updates
+        _live.setdefault(job_id, _LiveJob(next_seq))
+        _queue.put(session_id, job_id)
+        _announce_queue()
+
+def _remaining_seconds(job, now):
+    average = _durations["average"]
+    if job["eta"] is not None:
+        return max(0.0, job["eta"] - (now - job["planned_at"]))
+    return max(0.0, average - (now - job["started"]))
+
+def _announce_queue():
+    """
+    Sends every queued job its position and estimated start time, assuming
+    running jobs finish as planned and queued ones take the average duration.
+    """
+    now = time.monotonic()
+    average = _durations["average"]
+    # When each worker becomes free
+    free_at = [_remaining_seconds(job, now) for job in _running.values()]
+    free_at += [0.0] * max(0, _workers["count"] - len(free_at))
+    heapq.heapify(free_at)
+    if not free_at:
+        return
+
+    for position, job_id in enumerate(_queue.order(), start=1):
+        start = heapq.heappop(free_at)
+        heapq.heappush(free_at, start + average)
+        live = _live.get(job_id)
+        # A job with a free worker is about to start: nothing to wait for
+        if not live or not start or live.queue_state == (position, round(start)):
+            continue
+        live.queue_state = (position, round(start))
+        ahead = position - 1
+        message = (f"Waiting for {ahead} sync{'s' if ahead != 1 else ''} queued ahead of yours."
+                   if ahead else "Waiting for a free sync slot.")
+        live.publish({
+            "status": "queued",
+            "message": message,
+            "detail": f"Estimated start in {format_duration(start)}.",
+            "queue": {"position": position, "eta_seconds": round(start)}
+        })
+
+async def _claim(job_id):
+    """
+    Marks the job as running in this process. Fails if another worker holds a live lease on it.
+    """
+    database = db.get_db()
+    now = datetime.utcnow()
+    stale = now - timedelta(seconds=SYNC_JOB_LEASE_SECONDS)
+    return await database.sync_jobs.find_one_and_update(
+        {"job_id": job_id, "$or": [
+            {"status": "queued"},
+            {"status": "running", "heartbeat_at": {"$lt": stale}}
+        ]},
+        {"$set": {"status": "running", "heartbeat_at": now, "updated_at": now}},
+        projection={"events": 0}
+    )
+
+async def _checkpoint(job_id, events=(), completed_ids=(), next_seq=None, **fields):
+    database = db.get_db()
+    now = datetime.utcnow()
+    update = {"$set": {**fields, "heartbeat_at": now, "updated_at": now}}
+    if next_seq is not None:
+        update["$set"]["next_seq"] = next_seq
+    if events:
+        update["$push"] = {"events": {"$each": list(events), "$slice": -SYNC_JOB_EVENT_LOG_SIZE}}
+    if completed_ids:
+        update["$addToSet"] = {"completed_ids": {"$each": list(completed_ids)}}
+    await database.sync_jobs.update_one({"job_id": job_id}, update)
+
+async def _heartbeat(job_id, live):
+    while True:
+        await asyncio.sleep(SYNC_JOB_LEASE_SECONDS / 3)
+        try:
+            await _checkpoint(job_id, next_seq=live.next_seq)
+        except Exception as e:
+            print(f"Failed to renew lease on sync job {job_id}: {e}")
+
+async def _run_job(job):
+    job_id = job["job_id"]
+    session_id = job["session_id"]
+    live = _live.get(job_id) or _LiveJob()
+    _live[job_id] = live
+    # Another worker may have written events since this process queued the job
+    live.next_seq = max(live.next_seq, job.get("next_seq", 0))
+    heartbeat = asyncio.create_task(_heartbeat(job_id, live))
+    SYNCS_IN_PROGRESS.inc()
+    running = _running[job_id] = {"started": time.monotonic(), "eta": None, "planned_at": None}
+    _announce_queue()
+
+    async def emit(event, **fields):
+        if event.get("plan"):
+            running["eta"], running["planned_at"] = event["plan"]["eta_seconds"], time.monotonic()
+            _announce_queue()
+        event = live.publish(event)
+        if event["status"] in _LIVE_ONLY and not fields:
+            return
+        file = event.get("file")
+        completed_ids = [file["id"]] if event["status"] == "success" and file else ()
+        await _checkpoint(job_id, [event], completed_ids, live.next_seq, **fields)
+
+    client = None
+    try:
+        session = await get_session_data(session_id, JOB_SESSION_FIELDS) or {}
+        api_key = session.get("gemini_api_key")
+        if "credentials" not in session or not api_key:
+            await emit({"status": "error", "message": "Session expired or API key missing; sync cancelled."},
+                       status="error")
+            return
+
+        client = await run_bulk(get_client, api_key)
+        items = job["items"]
+        # Re-syncing the same selection reuses its store instead of creating another one
+        owner = store_owner(session_id, session)
+        key = folder_key(items)
+        existing = await find_store(owner, key, api_key) or {}
+
+        async def on_store_created(store_name):
+            await register_store(store_name, owner, key, session_id, api_key)
+
+        result = {}
+        async for event in sync_items(
+            session["credentials"], client, items, result,
+            store_name=existing.get("store_name"),
+            incremental=job["incremental"],
+            changes_token=existing.get("changes_token"),
+            on_store_created=on_store_created,
+            completed=set(job.get("completed_ids", [])),
+            fair_key=session_id
+        ):
+            await emit(event)
+
+        ready_count = result["uploaded_count"] + result["skipped_count"]
+        summary = {field: result[field] for field in ("store_name", "uploaded_count", "skipped_count", "removed_count")}
+        if result["store_name"] and (ready_count or result["removed_count"]):
+            await emit(progress_event("Initializing Chat Session...", detail="Providing context to the LLM"))
+
+            if result["uploaded_count"] or result["removed_count"]:
+                invalidate_store(result["store_name"]) # Cached answers may be stale now
+            await touch_store(result["store_name"], session_id, api_key, result["changes_token"])
+            # Only the fields the sync owns are written: the user may have changed
+            # the API key or logged out while it ran.
+            add = job.get("add", False)
+            changed = await attach_store(session_id, session, result["store_name"], key, job.get("name"), replace=not add)
+            if changed is None:
+                await emit(progress_event("Session ended before the sync finished.", status="error"),
+                           status="error", result=summary)
+                return
+            if changed:
+                if not add:
+                    await clear_history(session_id) # Reset history when the stores are replaced
+                invalidate_session(session_id)
+
+            await emit({
+                "status": "complete",
+                "message": f"Sync complete! {ready_count} files ready.",
+                "files": result["files"],
+                "updated": result["uploaded_count"],
+                "unchanged": result["skipped_count"],
+                "removed": result["removed_count"]
+            }, status="complete", result=summary)
+        elif result["files"]:
+            await emit(progress_event("Failed to sync any files.", status="error"), status="error", result=summary)
+        else:
+            await _checkpoint(job_id, status="error", result=summary)
+    except asyncio.CancelledError:
+        # Shutting down: hand the job back so the next worker resumes it right away.
+        await _checkpoint(job_id, status="queued")
+        raise
+    except Exception as e:
+        print(f"CRITICAL SYNC ERROR: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        await emit({"status": "error", "message": f"Critical Error: {str(e)}"}, status="error")
+    finally:
+        if client is not None:
+            close_client(client)
+        SYNCS_IN_PROGRESS.dec()
+        heartbeat.cancel()
+        live.finish()
+        _live.pop(job_id, None)
+        _running.pop(job_id, None)
+        duration = time.monotonic() - running["started"]
+        _durations["average"] = 0.7 * _durations["average"] + 0.3 * duration
+        _announce_queue()
+
+async def _worker():
+    while True:
+        job_id = await _queue.get()
+        _queued_ids.discard(job_id)
+        try:
+            job = await _claim(job_id)
+            if job:
+                await _run_job(job)
+            else:
+                # Another process got it first
+                _drop_live(job_id)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Sync job {job_id} failed: {e}")
+            _drop_live(job_id)
+
+def _drop_live(job_id):
+    live = _live.pop(job_id, None)
+    if live:
+        live.detach()
+    _announce_queue()
+
+async def _recover():
+    """
+    Re-queues jobs left queued, or running without a live worker, e.g. after a restart.
+    """
+    database = db.get_db()
+    while True:
+        try:
+            stale = datetime.utcnow() - timedelta(seconds=SYNC_JOB_LEASE_SECONDS)
+            async for job in database.sync_jobs.find(
+                {"$or": [{"status": "queued"}, {"status": "running", "heartbeat_at": {"$lt": stale}}]},
+                {"job_id": 1, "session_id": 1, "next_seq": 1}
+            ).sort("created_at", 1):
+                if job["job_id"] not in _live:
+                    _submit(job["job_id"], job["session_id"], job.get("next_seq", 0))
+        except Exception as e:
+            print(f"Failed to recover sync jobs: {e}")
+        await asyncio.sleep(SYNC_JOB_LEASE_SECONDS)
+
+def start_workers(count=SYNC_JOB_WORKERS):
+    _workers["count"] = count
+    _tasks.append(asyncio.create_task(_recover()))
+    _tasks.extend(asyncio.create_task(_worker()) for _ in range(count))
+
+async def stop_workers():
+    for task in _tasks:
+        task.cancel()
+    await asyncio.gather(*_tasks, return_exceptions=True)
+    _tasks.clear()
+    _workers["count"] = 0
@@ -0,0 +1,509 @@
+import asyncio
+import contextlib
+import time
+from collections import OrderedDict, deque
+from config import (
+    SYNC_CONCURRENCY_PER_SESSION, SYNC_CONCURRENCY_GLOBAL, SYNC_BYTE_BUDGET, SYNC_GLOBAL_BYTE_BUDGET,
+    SYNC_UNKNOWN_FILE_BYTES, SYNC_FILE_OVERHEAD_BYTES, SYNC_ESTIMATE_BYTES_PER_SECOND
+)
+from services.drive_service import (
+    FOLDER_MIME_TYPE, pooled_drive_service, crawl_files, download_file,
+    get_start_page_token, list_changed_file_ids
+)
+from services.rag_service import (
+    create_store, store_reachable, upload_file_to_store, delete_document, get_document_name, operation_by_name
+)
+from services.operation_tracker import tracker
+from services.manifest_service import (
+    get_manifest, save_manifest_entry, delete_manifest_entries, mark_pending, clear_pending
+)
+from services.executor import run_bulk
+from services.metrics import SYNC_FILES
+
+_DONE = object()
+
+# Observed sync throughput, in bytes of work (file size plus SYNC_FILE_OVERHEAD_BYTES
+# per file) per second, averaged over recent syncs in this process.
+_throughput = {"bytes_per_second": SYNC_ESTIMATE_BYTES_PER_SECOND}
+
+def progress_event(msg, detail=None, status="progress", file=None):
+    event = {"status": status, "message": msg, "detail": detail}
+    if file is not None:
+        event["file"] = file
+    return event
+
+def _run_upload(loop, events, label, tag, **kwargs):
+    """
+    Drives the upload_file_to_store generator in a worker thread,
+    forwarding its progress messages to the event loop.
+    Returns (store_name, operation).
+    """
+    generator = upload_file_to_store(**kwargs)
+    while True:
+        try:
+            msg = next(generator)
+        except StopIteration as e:
+            return e.value
+        loop.call_soon_threadsafe(
+            events.put_nowait,
+            progress_event(f"Processing {label}", detail=msg, file=tag)
+        )
+
+def _file_size(file_meta):
+    size = file_meta.get('size')
+    return int(size) if size else None
+
+def _file_work(file_meta):
+    return (_file_size(file_meta) or SYNC_UNKNOWN_FILE_BYTES) + SYNC_FILE_OVERHEAD_BYTES
+
+def _record_throughput(work, seconds):
+    if work and seconds > 1:
+        observed = work / seconds
+        _throughput["bytes_per_second"] = 0.7 * _throughput["bytes_per_second"] + 0.3 * observed
+
+def format_bytes(size):
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+
+def format_duration(seconds):
+    if seconds < 60:
+        return f"{max(1, round(seconds))}s"
+    if seconds < 3600:
+        return f"{round(seconds / 60)} min"
+    return f"{seconds / 3600:.1f} h"
+
+class _SyncScheduler:
+    """
+    Hands planned files to workers while keeping the bytes held by in-progress
+    files under `budget` (a file bigger than the budget runs on its own).
+    Large files go largest first and small ones smallest first. While small
+    files remain, at most `large_slots` large files run at once, so the other
+    workers keep making small files queryable instead of queueing behind a
+    big download.
+    """
+
+    def __init__(self, entries, budget, large_slots):
+        # entries: (index, file_meta, bytes)
+        ordered = sorted(entries, key=lambda entry: entry[2])
+        # "Large" means well above the typical (median) file of this sync
+        threshold = 2 * ordered[len(ordered) // 2][2] if ordered else 0
+        self._small = deque(entry for entry in ordered if entry[2] <= threshold)
+        self._large = deque(entry for entry in reversed(ordered) if entry[2] > threshold)
+        self._budget = budget
+        self._large_slots = large_slots
+        self._bytes_in_flight = 0
+        self._large_in_flight = 0
+        self._changed = asyncio.Condition()
+
+    async def next(self):
+        """
+        Returns the next (index, file_meta, bytes, is_large) to process, or None when all are handed out.
+        """
+        async with self._changed:
+            while self._small or self._large:
+                entry = self._pick()
+                if entry:
+                    return entry
+                await self._changed.wait()
+            return None
+
+    async def release(self, entry):
+        async with self._changed:
+            self._bytes_in_flight -= entry[2]
+            if entry[3]:
+                self._large_in_flight -= 1
+            self._changed.notify_all()
+
+    def _fits(self, entry):
+        return self._bytes_in_flight == 0 or self._bytes_in_flight + entry[2] <= self._budget
+
+    def _pick(self):
+        if self._large and (self._large_in_flight < self._large_slots or not self._small) and self._fits(self._large[0]):
+            entry, is_large = self._large.popleft(), True
+        elif self._small and self._fits(self._small[0]):
+            entry, is_large = self._small.popleft(), False
+        else:
+            return None
+        self._bytes_in_flight += entry[2]
+        self._large_in_flight += is_large
+        return (*entry, is_large)
+
+class _FileAdmission:
+    """
+    Process-wide limit on the files being processed (`slots`) and on their
+    bytes (`budget`; a bigger file runs only when nothing else does), shared by
+    every sync so that many concurrent sessions cannot oversubscribe memory or
+    Drive/Gemini bandwidth. Waiting files are admitted round-robin between
+    syncs: one with thousands of files cannot starve one that just started.
+    """
+
+    def __init__(self, slots, budget):
+        self._slots = slots
+        self._budget = budget
+        self._files = 0
+        self._bytes = 0
+        # sync key -> deque of (bytes, future), in the order syncs take turns
+        self._waiting = OrderedDict()
+
+    @contextlib.asynccontextmanager
+    async def admit(self, sync_key, size):
+        await self._acquire(sync_key, size)
+        try:
+            yield
+        finally:
+            self._release(size)
+
+    async def _acquire(self, sync_key, size):
+        if not self._waiting and self._fits(size):
+            self._take(size)
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._waiting.setdefault(sync_key, deque()).append((size, future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.cancelled():
+                self._forget(sync_key, (size, future))
+            else:
+                # Admitted just as we were cancelled: give the slot back
+                self._release(size)
+            raise
+
+    def _fits(self, size):
+        return self._files < self._slots and (self._bytes == 0 or self._bytes + size <= self._budget)
+
+    def _take(self, size):
+        self._files += 1
+        self._bytes += size
+
+    def _release(self, size):
+        self._files -= 1
+        self._bytes -= size
+        self._dispatch()
+
+    def _forget(self, sync_key, waiter):
+        queue = self._waiting.get(sync_key)
+        if queue and waiter in queue:
+            queue.remove(waiter)
+        if queue is not None and not queue:
+            del self._waiting[sync_key]
+        self._dispatch()
+
+    def _dispatch(self):
+        while self._waiting:
+            sync_key, queue = next(iter(self._waiting.items()))
+            size, future = queue[0]
+            if future.done():
+                # Cancelled; its waiter has not run yet to remove it
+                queue.popleft()
+            elif not self._fits(size):
+                return
+            else:
+                queue.popleft()
+                self._take(size)
+                future.set_result(None)
+            # This sync goes to the back of the line
+            if queue:
+                self._waiting.move_to_end(sync_key)
+            else:
+                del self._waiting[sync_key]
+
+_admission = _FileAdmission(SYNC_CONCURRENCY_GLOBAL, SYNC_GLOBAL_BYTE_BUDGET)
+
+def _is_unchanged(entry, file_meta, changed_ids):
+    """
+    Decides whether a file already indexed according to the manifest can be skipped.
+    """
+    if entry is None:
+        return False
+    known = [key for key in ('md5Checksum', 'modifiedTime') if file_meta.get(key)]
+    if known:
+        return all(file_meta[key] == entry.get(key) for key in known)
+    # Directly selected items carry no metadata: rely on the Changes API cursor.
+    return changed_ids is not None and file_meta['id'] not in changed_ids
+
+async def _discard_pending(client, store_name, manifest, entry):
+    """
+    Removes the document an interrupted sync uploaded but never recorded; the
+    file is uploaded again like any other. Waits for its indexing to finish
+    first, since the document name is only known then.
+    """
+    try:
+        operation = await tracker.wait(client, operation_by_name(entry["pending_operation"]))
+        document_name = get_document_name(operation)
+        if document_name and document_name != entry.get("document_name"):
+            await run_bulk(delete_document, client, document_name)
+    except Exception as e:
+        # Indexing failed (nothing to remove) or the operation is gone
+        print(f"Could not clean up interrupted upload of {entry.get('name')}: {e}")
+    await clear_pending(store_name, entry["file_id"])
+    del entry["pending_operation"]
+    if not entry.get("document_name"):
+        manifest.pop(entry["file_id"], None)
+
+async def sync_items(credentials_data, client, items, result, store_name=None, incremental=False,
+                     changes_token=None, on_store_created=None, completed=None, fair_key=None,
+                     concurrency=SYNC_CONCURRENCY_PER_SESSION, byte_budget=SYNC_BYTE_BUDGET):
+    """
+    Downloads the selected Drive items and uploads them to a File Search store.
+    The selection is crawled and planned first (file count, total bytes and an
+    estimated duration are reported), then up to `concurrency` files are
+    downloaded and uploaded at once, scheduled by _SyncScheduler under
+    `byte_budget`. Across all syncs in the process, files are admitted
+    round-robin by `fair_key` (e.g. the session id; by default each sync is
+    its own key) under SYNC_CONCURRENCY_GLOBAL and SYNC_GLOBAL_BYTE_BUDGET.
+    Indexing waits are handed to the shared operation tracker and do not hold
+    a worker.
+
+    `store_name` is the existing store for this selection, if any; otherwise
+    (or if the client's API key cannot reach it) a store is created on first
+    upload and passed to `on_store_created(store_name)`.
+    The store's manifest decides which documents to replace: a full sync
+    re-indexes every file, an incremental one only files that the manifest and
+    the Changes API cursor (`changes_token`) say were added or changed. Either
+    way, documents for files no longer in the selection are deleted.
+
+    `completed` holds ids of files an interrupted run of the same sync already
+    indexed; they are counted as uploaded and not processed again.
+
+    Yields progress event dicts. On return, `result` holds store_name,
+    uploaded_count, skipped_count, removed_count, files and changes_token.
+    """
+    concurrency = max(1, concurrency)
+    loop = asyncio.get_running_loop()
+    events = asyncio.Queue()
+    store_lock = asyncio.Lock()
+    indexing = set()
+
+    incremental = bool(incremental and store_name)
+    completed = completed or set()
+    fair_key = fair_key if fair_key is not None else object()
+    result.update({
+        "store_name": store_name,
+        "uploaded_count": 0,
+        "skipped_count": 0,
+        "removed_count": 0,
+        "files": [],
+        "changes_token": None
+    })
+    # Work (see _file_work) of the files indexed so far, for throughput estimates
+    indexed = {"work": 0}
+
+    yield progress_event("Scanning files...", status="info")
+
+    with pooled_drive_service(credentials_data) as service:
+        try:
+            # Taken before listing so nothing changed during the sync is missed next time.
+            result["changes_token"] = await run_bulk(get_start_page_token, service)
+        except Exception as e:
+            print(f"Could not fetch Drive changes token: {e}")
+
+        changed_ids = None
+        if incremental and changes_token:
+            try:
+                changed_ids = await run_bulk(list_changed_file_ids, service, changes_token)
+            except Exception as e:
+                print(f"Could not list Drive changes, comparing checksums only: {e}")
+
+    if store_name and not await run_bulk(store_reachable, client, store_name):
+        # e.g. the user switched to an API key from another project: index into a new store
+        yield progress_event("The existing store is not available with this API key; creating a new one.", status="info")
+        store_name = result["store_name"] = None
+        incremental = False
+        completed = set()
+
+    manifest = await get_manifest(store_name) if store_name else {}
+    pending = [entry for entry in manifest.values() if entry.get("pending_operation")]
+    if pending:
+        yield progress_event(f"Cleaning up {len(pending)} uploads left by an interrupted sync...", status="info")
+        await asyncio.gather(*(_discard_pending(client, store_name, manifest, entry) for entry in pending))
+    if incremental:
+        yield progress_event(f"Incremental sync: {len(manifest)} files already indexed.", status="info")
+
+    async def ensure_store():
+        # The first file to reach the upload stage creates the store; everyone else reuses it.
+        async with store_lock:
+            if not result["store_name"]:
+                result["store_name"] = await run_bulk(create_store, client)
+                if on_store_created:
+                    await on_store_created(result["store_name"])
+            return result["store_name"]
+
+    async def finish_indexing(operation, store_name, file_meta, tag):
+        # Runs after the worker has moved on to its next file.
+        try:
+            operation = await tracker.wait(client, operation)
+            document_name = get_document_name(operation)
+
+            await save_manifest_entry(store_name, {
+                "file_id": file_meta['id'],
+                "name": file_meta['name'],
+                "md5Checksum": file_meta.get('md5Checksum'),
+                "modifiedTime": file_meta.get('modifiedTime'),
+                "document_name": document_name
+            })
+
+            # The new version is indexed; now drop the one it replaces.
+            previous = manifest.get(file_meta['id'])
+            if previous and previous.get("document_name") and previous["document_name"] != document_name:
+                try:
+                    await run_bulk(delete_document, client, previous["document_name"])
+                except Exception as e:
+                    print(f"Failed to delete previous version of {file_meta['name']}: {e}")
+
+            result["uploaded_count"] += 1
+            indexed["work"] += _file_work(file_meta)
+            SYNC_FILES.labels("uploaded").inc()
+            events.put_nowait(progress_event(f"Successfully processed: {file_meta['name']}", status="success", file=tag))
+        except Exception as e:
+            SYNC_FILES.labels("failed").inc()
+            events.put_nowait(progress_event(f"Failed to process {file_meta['name']}: {str(e)}", status="error", file=tag))
+            await clear_pending(store_name, file_meta['id'])
+
+    async def process_file(worker_service, index, file_meta):
+        label = f"{index + 1}/{len(result['files'])}: {file_meta['name']}"
+        tag = {"id": file_meta['id'], "name": file_meta['name'], "index": index}
+        events.put_nowait(progress_event(f"Processing {label}", detail="Downloading data", file=tag))
+
+        try:
+            download, upload_mime_type = await run_bulk(download_file, worker_service, file_meta['id'], file_meta['mimeType'])
+
+            # The spooled download is uploaded as it is, without another copy
+            with download:
+                store_name = await ensure_store()
+                _, operation = await run_bulk(
+                    _run_upload, loop, events, label, tag,
+                    client=client,
+                    file_content=download,
+                    display_name=file_meta['name'],
+                    mime_type=upload_mime_type,
+                    store_name=store_name
+                )
+
+            # Until finish_indexing saves the manifest entry, this is all that tracks the new document
+            await mark_pending(store_name, file_meta['id'], file_meta['name'], operation.name)
+            indexing.add(asyncio.create_task(finish_indexing(operation, store_name, file_meta, tag)))
+        except Exception as e:
+            SYNC_FILES.labels("failed").inc()
+            events.put_nowait(progress_event(f"Failed to process {file_meta['name']}: {str(e)}", status="error", file=tag))
+
+    async def worker(scheduler):
+        while True:
+            entry = await scheduler.next()
+            if entry is None:
+                return
+            try:
+                async with _admission.admit(fair_key, entry[2]):
+                    # googleapiclient services are not thread-safe, so each file checks one out.
+                    with pooled_drive_service(credentials_data) as worker_service:
+                        await process_file(worker_service, entry[0], entry[1])
+            finally:
+                await scheduler.release(entry)
+
+    def plan_event(planned):
+        total_bytes = sum(_file_size(file_meta) or 0 for _, file_meta in planned)
+        unknown = sum(1 for _, file_meta in planned if _file_size(file_meta) is None)
+        eta = sum(_file_work(file_meta) for _, file_meta in planned) / _throughput["bytes_per_second"]
+        detail = f"{unknown} Google files are exported, so their size is not known in advance." if unknown else None
+        event = progress_event(
+            f"Planned {len(planned)} files ({format_bytes(total_bytes)}), estimated time {format_duration(eta)}.",
+            detail=detail, status="info"
+        )
+        event["plan"] = {"files": len(planned), "bytes": total_bytes, "unknown_size": unknown, "eta_seconds": round(eta)}
+        return event
+
+    async def plan_and_run():
+        # Planning needs the whole listing, so every file is found before any download starts.
+        seen = set()
+        planned = []
+
+        def enqueue(file_meta):
+            if file_meta['id'] in seen:
+                return
+            seen.add(file_meta['id'])
+            index = len(result["files"])
+            result["files"].append(file_meta['name'])
+            if file_meta['id'] in completed:
+                result["uploaded_count"] += 1
+                return
+            if incremental and _is_unchanged(manifest.get(file_meta['id']), file_meta, changed_ids):
+                result["skipped_count"] += 1
+                SYNC_FILES.labels("unchanged").inc()
+                return
+            planned.append((index, file_meta))
+
+        try:
+            for item in items:
+                if item['mimeType'] != FOLDER_MIME_TYPE:
+                    enqueue(item)
+
+            folder_ids = [item['id'] for item in items if item['mimeType'] == FOLDER_MIME_TYPE]
+            if folder_ids:
+                names = ", ".join(item['name'] for item in items if item['mimeType'] == FOLDER_MIME_TYPE)
+                events.put_nowait(progress_event(f"Scanning folder: {names}...", status="info"))
+                async for file_meta in crawl_files(credentials_data, folder_ids):
+                    enqueue(file_meta)
+
+            if result["files"]:
+                events.put_nowait(progress_event(f"Found {len(result['files'])} files to process.", status="info"))
+            else:
+                events.put_nowait(progress_event("No files found to sync.", status="error"))
+
+            if completed:
+                events.put_nowait(progress_event(f"Resuming: {len(completed & seen)} files were already processed.", status="info"))
+            if result["skipped_count"]:
+                events.put_nowait(progress_event(f"Skipping {result['skipped_count']} unchanged files.", status="info"))
+
+            # Only a complete crawl tells us what was removed.
+            removed = [entry for file_id, entry in manifest.items() if file_id not in seen]
+            for entry in removed:
+                try:
+                    if entry.get("document_name"):
+                        await run_bulk(delete_document, client, entry["document_name"])
+                    await delete_manifest_entries(store_name, [entry["file_id"]])
+                    result["removed_count"] += 1
+                    SYNC_FILES.labels("removed").inc()
+                    events.put_nowait(progress_event(f"Removed: {entry['name']}", status="info"))
+                except Exception as e:
+                    events.put_nowait(progress_event(f"Failed to remove {entry['name']}: {str(e)}", status="error"))
+        except Exception as e:
+            # Files found before the failure are still synced.
+            events.put_nowait(progress_event(f"Failed to scan folders: {str(e)}", status="error"))
+
+        if not planned:
+            return
+        events.put_nowait(plan_event(planned))
+
+        started = time.monotonic()
+        scheduler = _SyncScheduler(
+            [(index, file_meta, _file_size(file_meta) or SYNC_UNKNOWN_FILE_BYTES) for index, file_meta in planned],
+            byte_budget, large_slots=max(1, concurrency // 2)
+        )
+        await asyncio.gather(*(worker(scheduler) for _ in range(concurrency)))
+        # Workers are done submitting; wait for the last files to finish indexing.
+        await asyncio.gather(*indexing, return_exceptions=True)
+        _record_throughput(indexed["work"], time.monotonic() - started)
+
+    async def close_when_finished():
+        try:
+            await runner
+        except Exception as e:
+            events.put_nowait(progress_event(f"Sync failed: {str(e)}", status="error"))
+        events.put_nowait(_DONE)
+
+    runner = asyncio.create_task(plan_and_run())
+    closer = asyncio.create_task(close_when_finished())
+
+    try:
+        while True:
+            event = await events.get()
+            if event is _DONE:
+                break
+            yield event
+    finally:
+        # Client went away or the consumer stopped early: don't leave workers running.
+        for task in [runner, *indexing]:
+            task.cancel()
+        closer.cancel()
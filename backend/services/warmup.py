@@ -0,0 +1,51 @@
+import time
+from database import db
+from services.executor import run_bulk
+from services.metrics import STARTUP_SECONDS
+
+# Work done once after startup, in the background, so the server accepts
+# requests immediately and the first real request does not pay for it.
+status = {"ready": False, "seconds": None}
+
+def _warm_sdks():
+    """
+    Imports the Google SDKs that are loaded lazily and parses the discovery
+    documents used at runtime, so the first login, sync and chat find them ready.
+    """
+    import httplib2
+    import google_auth_oauthlib.flow
+    import googleapiclient.http
+    from googleapiclient.discovery import build_from_document
+    from google.genai import types
+    from services.google_api import get_discovery_document
+    from services.rag_service import _genai
+
+    _genai()
+    for api, version in (("drive", "v3"), ("sheets", "v4"), ("oauth2", "v2")):
+        get_discovery_document(api, version)
+    # Building one service runs the rest of discovery's one-time setup
+    build_from_document(get_discovery_document("drive", "v3"), http=httplib2.Http())
+
+async def warm_up():
+    """
+    Pings MongoDB (opening the connection pool), creates indexes and warms the
+    Google SDKs. Failures are logged; the app still serves and retries lazily.
+    """
+    started = time.perf_counter()
+    try:
+        await db.ping()
+    except Exception as e:
+        print(f"MongoDB ping failed during warm-up: {e}")
+    try:
+        await db.ensure_indexes()
+    except Exception as e:
+        print(f"Failed to create MongoDB indexes: {e}")
+    try:
+        await run_bulk(_warm_sdks)
+    except Exception as e:
+        print(f"SDK warm-up failed: {e}")
+
+    status["seconds"] = round(time.perf_counter() - started, 3)
+    status["ready"] = True
+    STARTUP_SECONDS.labels("warmup").set(status["seconds"])
+    print(f"Warm-up finished in {status['seconds']}s")
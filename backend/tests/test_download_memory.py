@@ -0,0 +1,34 @@
+import tracemalloc
+
+from googleapiclient.discovery import build_from_document
+
+from benchmarks.fake_drive import FakeDrive
+from services import drive_service
+from services.google_api import get_discovery_document
+
+CHUNK_SIZE = 256 * 1024
+SPOOL_MAX_BYTES = 1024 * 1024
+FILE_SIZE = 32 * 1024 * 1024
+
+def test_download_peak_memory_is_bounded_by_spool_and_chunk(monkeypatch):
+    monkeypatch.setattr(drive_service, "DRIVE_SPOOL_MAX_BYTES", SPOOL_MAX_BYTES)
+    drive = FakeDrive(folders=1, depth=1, files_per_folder=1, min_size=FILE_SIZE, max_size=FILE_SIZE,
+                      doc_ratio=0, latency=0, bandwidth=1e12)
+    file = drive.files[0]
+    service = build_from_document(get_discovery_document("drive", "v3"), http=drive)
+
+    tracemalloc.start()
+    try:
+        download, mime_type = drive_service.download_file(service, file["id"], file["mimeType"], chunk_size=CHUNK_SIZE)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    with download:
+        assert mime_type == file["mimeType"]
+        assert download.seek(0, 2) == FILE_SIZE
+        assert download._rolled # spilled to disk instead of growing in memory
+    # The in-memory part of the spool (copied once when it rolls over to disk)
+    # plus the chunk in flight, whatever the size of the file
+    assert peak < 2 * SPOOL_MAX_BYTES + 2 * CHUNK_SIZE, f"peak {peak} bytes"
+    assert peak < FILE_SIZE / 10
@@ -0,0 +1,78 @@
+import asyncio
+import json
+import time
+
+import httpx
+from googleapiclient.discovery import build_from_document
+from mongomock_motor import AsyncMongoMockClient
+
+from benchmarks.bench import API_KEY, CREDENTIALS, percentiles
+from benchmarks.fake_drive import FakeDrive, FOLDER_MIME_TYPE
+from benchmarks.fake_genai import FakeGenai
+
+SESSION_ID = "test-sync"
+
+def install_fakes(monkeypatch, drive, gemini):
+    import database
+    from services import google_api, rag_service
+
+    def build_service(api, version, credentials):
+        return build_from_document(google_api.get_discovery_document(api, version), http=drive)
+
+    monkeypatch.setattr(google_api, "build_service", build_service)
+    monkeypatch.setattr(rag_service, "genai", gemini)
+    monkeypatch.setattr(database.db, "client", AsyncMongoMockClient())
+    return database.db
+
+async def probe_health(client, samples, stop):
+    while not stop.is_set():
+        started = time.perf_counter()
+        response = await client.get("/health")
+        samples.append(time.perf_counter() - started)
+        assert response.status_code == 200
+        await asyncio.sleep(0.02)
+
+async def sync_while_probing(db):
+    import main
+    from services import sync_jobs
+
+    await db.get_db().sessions.insert_one({
+        "session_id": SESSION_ID, "credentials": CREDENTIALS, "gemini_api_key": API_KEY,
+        "user": {"email": "test@example.com"}
+    })
+    sync_jobs.start_workers()
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test") as client:
+            idle, during, stop = [], [], asyncio.Event()
+            for _ in range(10):
+                started = time.perf_counter()
+                await client.get("/health")
+                idle.append(time.perf_counter() - started)
+
+            prober = asyncio.create_task(probe_health(client, during, stop))
+            items = [{"id": FakeDrive.ROOT_ID, "name": "Test", "mimeType": FOLDER_MIME_TYPE}]
+            response = await client.post("/api/sync", json={"items": items}, headers={"x-session-id": SESSION_ID})
+            stop.set()
+            await prober
+    finally:
+        await sync_jobs.stop_workers()
+
+    events = [json.loads(line) for line in response.text.splitlines() if line.strip()]
+    return idle, during, events
+
+def test_health_latency_stays_flat_during_sync(monkeypatch):
+    # Slow backends keep the sync's blocking calls busy for a few seconds
+    drive = FakeDrive(folders=2, depth=1, files_per_folder=10, min_size=200_000, max_size=2_000_000,
+                      latency=0.05, bandwidth=20_000_000)
+    gemini = FakeGenai(upload_latency=0.1, upload_bandwidth=10_000_000, index_latency=0.5, index_rate=5_000_000)
+    db = install_fakes(monkeypatch, drive, gemini)
+
+    idle, during, events = asyncio.run(sync_while_probing(db))
+
+    assert events[-1]["status"] == "complete", events[-1]
+    assert events[-1]["updated"] == len(drive.files)
+    assert len(during) >= 20, "the sync finished before /health could be probed"
+    idle_ms, during_ms = percentiles(idle), percentiles(during)
+    # The event loop is never blocked by Drive or Gemini calls
+    assert during_ms["p95"] < max(50, 5 * idle_ms["p95"]), (idle_ms, during_ms)
+    assert during_ms["max"] < 250, (idle_ms, during_ms)
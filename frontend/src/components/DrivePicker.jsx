@@ -3,6 +3,8 @@ import { API_BASE_URL } from '../config';
 
 const DrivePicker = ({ onSyncComplete, selectedFiles, setSelectedFiles, syncStatus, setSyncStatus }) => {
     const [files, setFiles] = useState([]);
+    const [nextPageToken, setNextPageToken] = useState(null);
+    const [loadingMore, setLoadingMore] = useState(false);
     const [currentFolder, setCurrentFolder] = useState('root');
     const [folderStack, setFolderStack] = useState([{ id: 'root', name: 'Drive' }]);
     const [loading, setLoading] = useState(false);
@@ -20,20 +22,23 @@ const DrivePicker = ({ onSyncComplete, selectedFiles, setSelectedFiles, syncStat
         }
     }, [syncStatus]);
 
-    const fetchFiles = async (folderId) => {
-        setLoading(true);
+    const fetchFiles = async (folderId, pageToken = null) => {
+        pageToken ? setLoadingMore(true) : setLoading(true);
         try {
             const sessionId = localStorage.getItem('session_id');
-            const response = await fetch(`${API_BASE_URL}/api/drive/list?folder_id=${folderId}`, {
+            const params = new URLSearchParams({ folder_id: folderId });
+            if (pageToken) params.set('page_token', pageToken);
+            const response = await fetch(`${API_BASE_URL}/api/drive/list?${params}`, {
                 headers: { 'x-session-id': sessionId }
             });
             if (!response.ok) throw new Error('Failed to fetch files');
             const data = await response.json();
-            setFiles(data.files);
+            setFiles(prev => pageToken ? [...prev, ...data.files] : data.files);
+            setNextPageToken(data.nextPageToken || null);
         } catch (error) {
             console.error(error);
         } finally {
-            setLoading(false);
+            pageToken ? setLoadingMore(false) : setLoading(false);
         }
     };
 
@@ -58,6 +63,38 @@ const DrivePicker = ({ onSyncComplete, selectedFiles, setSelectedFiles, syncStat
         }
     };
 
+    const readSyncStream = async (response, stream) => {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffered = '';
+
+        try {
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) break;
+
+                buffered += decoder.decode(value, { stream: true });
+                const lines = buffered.split('\n');
+                buffered = lines.pop();
+
+                for (const line of lines) {
+                    if (line.trim()) {
+                        try {
+                            const update = JSON.parse(line);
+                            if (update.job_id) stream.jobId = update.job_id;
+                            if (update.seq !== undefined) stream.lastSeq = update.seq;
+                            setSyncStatus(update);
+                        } catch (e) {
+                            console.error("Error parsing stream:", e);
+                        }
+                    }
+                }
+            }
+        } catch (e) {
+            console.error("Sync stream interrupted:", e);
+        }
+    };
+
     const handleSync = async () => {
         if (selectedFiles.length === 0) return;
 
@@ -80,26 +117,31 @@ const DrivePicker = ({ onSyncComplete, selectedFiles, setSelectedFiles, syncStat
                 throw new Error(errorData.detail || 'Sync failed');
             }
 
-            const reader = response.body.getReader();
-            const decoder = new TextDecoder();
+            // The sync runs as a background job: if the stream drops before it finishes, reattach
+            const stream = { jobId: null, lastSeq: -1 };
+            await readSyncStream(response, stream);
+            for (let attempt = 0; stream.jobId && attempt < 5; attempt++) {
+                try {
+                    const statusResponse = await fetch(`${API_BASE_URL}/api/sync/${stream.jobId}`, {
+                        headers: { 'x-session-id': sessionId }
+                    });
+                    if (statusResponse.ok) {
+                        const job = await statusResponse.json();
+                        if (job.status === 'complete' || job.status === 'error') break;
 
-            while (true) {
-                const { value, done } = await reader.read();
-                if (done) break;
-
-                const chunk = decoder.decode(value);
-                const lines = chunk.split('\n');
-
-                for (const line of lines) {
-                    if (line.trim()) {
-                        try {
-                            const update = JSON.parse(line);
-                            setSyncStatus(update);
-                        } catch (e) {
-                            console.error("Error parsing stream:", e);
+                        const retry = await fetch(`${API_BASE_URL}/api/sync/${stream.jobId}/stream?after=${stream.lastSeq}`, {
+                            headers: { 'x-session-id': sessionId }
+                        });
+                        if (retry.ok) {
+                            attempt = -1;
+                            await readSyncStream(retry, stream);
+                            continue;
                         }
                     }
+                } catch (e) {
+                    console.error("Error reattaching to sync:", e);
                 }
+                await new Promise(resolve => setTimeout(resolve, 1000 * (attempt + 1)));
             }
         } catch (error) {
             setSyncStatus({ status: 'error', message: 'Sync failed', detail: error.message });
@@ -214,6 +256,7 @@ const DrivePicker = ({ onSyncComplete, selectedFiles, setSelectedFiles, syncStat
                 ) : (
                     <div className="max-w-7xl mx-auto pb-20">
                         {files.length > 0 ? (
+                            <>
                             <div className="grid grid-cols-2 sm:grid-cols-3 md:grid-cols-4 lg:grid-cols-5 xl:grid-cols-6 gap-4">
                                 {files.map((file) => {
                                     const isSelected = selectedFiles.find(i => i.id === file.id);
@@ -252,6 +295,18 @@ const DrivePicker = ({ onSyncComplete, selectedFiles, setSelectedFiles, syncStat
                                     );
                                 })}
                             </div>
+                            {nextPageToken && (
+                                <div className="flex justify-center mt-8">
+                                    <button
+                                        onClick={() => fetchFiles(currentFolder, nextPageToken)}
+                                        disabled={loadingMore}
+                                        className="px-6 py-2 bg-bg-secondary hover:bg-white/10 rounded-xl text-text-primary transition-colors font-medium disabled:opacity-50"
+                                    >
+                                        {loadingMore ? 'Loading...' : 'Load more'}
+                                    </button>
+                                </div>
+                            )}
+                            </>
                         ) : (
                             <div className="flex flex-col items-center justify-center py-32 text-text-secondary">
                                 <div className="w-24 h-24 bg-bg-secondary rounded-full flex items-center justify-center mb-6">